@@ -0,0 +1,814 @@
+#!/usr/bin/env python3
+# scripts/nbp_rates.py
+# API odczytu kursów z magazynu docs/exc (pliki .json i .json.gz) z ograniczonym cache LRU.
+#
+# Użycie z innego skryptu:
+#   sys.path.insert(0, "scripts")
+#   import nbp_rates
+#   nbp_rates.get_rate("2024-05-06", "EUR")
+#   nbp_rates.get_series("USD", "2024-01-01", "2024-12-31")
+#   nbp_rates.get_bid_ask("2024-05-06", "EUR")   # tabela C (docs/exc_c)
+#   nbp_rates.get_rate_asof("2024-05-06", "AFN")  # waluty spoza tabeli A — z tabeli B (docs/exc_b)
+#   nbp_rates.get_gold_price("2024-05-06")         # cena 1 g złota (docs/exc_gold.csv)
+#
+# Katalog magazynu: NBP_OUT_DIR (domyślnie docs/exc), rozmiar cache: NBP_CACHE_SIZE.
+
+from datetime import date, datetime, timedelta
+from collections import OrderedDict
+import argparse
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Optional, Union
+from zoneinfo import ZoneInfo
+
+import save_nbp_rates as store
+
+try:
+    import numpy as np
+except ImportError:  # numpy jest opcjonalny — bez niego konwersja wsadowa działa w czystym Pythonie
+    np = None
+
+CACHE_SIZE = int(os.getenv("NBP_CACHE_SIZE", "512"))
+
+# Pary walut liczone z góry przy budowie RateGrid, np. "EUR/USD,CHF/GBP"
+HOT_PAIRS = [p.strip().upper() for p in os.getenv("NBP_HOT_PAIRS", "EUR/USD").split(",") if p.strip()]
+
+# Dyskowy cache posortowanego indeksu opublikowanych dat
+DATE_INDEX_PATH = os.path.join(store.BASE_OUT_DIR, ".date_index.json")
+# Co ile sekund load_date_index sprawdza mtime katalogów lat (nowe dni w działającym procesie)
+DATE_INDEX_CHECK_S = float(os.getenv("NBP_DATE_INDEX_CHECK_S", "1"))
+
+DateLike = Union[date, str]
+
+
+def _as_date(d: DateLike) -> date:
+    if isinstance(d, date):
+        return d
+    return date.fromisoformat(str(d)[:10])
+
+
+class TableCache:
+    """
+    Ograniczony cache LRU zdekodowanych tabel dziennych, kluczowany datą.
+    Przechowuje też wynik negatywny (brak pliku), żeby weekendy nie trafiały ciągle na dysk —
+    poza dniem dzisiejszym i przyszłymi, dla których NBP może jeszcze opublikować tabelę.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = max(1, maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = loader(key)
+        if value is None and isinstance(key, date) and key >= datetime.now(ZoneInfo(store.TZ)).date():
+            return value
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def discard(self, predicate):
+        """
+        Usuwa wpisy, dla których predicate(klucz, wartość) jest prawdziwe.
+        """
+        with self._lock:
+            for key in [k for k, v in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+    def info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+
+_tables = TableCache(CACHE_SIZE)
+_tables_c = TableCache(CACHE_SIZE)
+_archives = TableCache(32)
+_table_b_years = TableCache(32)
+
+# API NBP udostępnia tabele od 2002 r. — dalej wstecz as-of dla tabeli B nie szuka
+FIRST_YEAR = 2002
+
+
+def _load_table(d: date, table: str = "A"):
+    path = store.find_existing_path(d, table)
+    if path is None:
+        return None
+    data = store.read_json_from_file(path)
+    if not isinstance(data, dict):
+        return None
+    # pliki "slim" ({"date","mid":{...}}) są rozwijane do {"date","rates"} z nazwami z currencies.json
+    data = store.expand_payload(data)
+    # indeks kod -> wpis, żeby get_rate nie przeszukiwał listy przy każdym wywołaniu
+    by_code = {r["code"]: r for r in data.get("rates", []) if isinstance(r, dict) and r.get("code")}
+    return data, by_code
+
+
+def get_table(d: DateLike) -> Optional[dict]:
+    """
+    Zwraca tabelę dnia ({"date", "rates"}) albo None, jeśli NBP jej nie opublikował.
+    Zwrócony obiekt pochodzi z cache — nie należy go modyfikować.
+    """
+    _check_store()
+    cached = _tables.get(_as_date(d), _load_table)
+    return cached[0] if cached else None
+
+
+def get_rate(d: DateLike, code: str) -> Optional[float]:
+    """
+    Kurs średni (mid) waluty code w dniu d albo None.
+    """
+    _check_store()
+    cached = _tables.get(_as_date(d), _load_table)
+    if not cached:
+        return None
+    entry = cached[1].get(code.upper())
+    return entry.get("mid") if entry else None
+
+
+def get_bid_ask(d: DateLike, code: str):
+    """
+    Kurs kupna i sprzedaży (bid, ask) waluty code z tabeli C dnia d albo None.
+    """
+    _check_store()
+    cached = _tables_c.get(_as_date(d), lambda key: _load_table(key, "C"))
+    if not cached:
+        return None
+    entry = cached[1].get(code.upper())
+    if not entry or "bid" not in entry or "ask" not in entry:
+        return None
+    return entry["bid"], entry["ask"]
+
+
+def get_series(code: str, start: DateLike, end: DateLike):
+    """
+    Zwraca listę (date, mid) dla waluty code w zakresie [start, end].
+    Lata z archiwum rocznym są czytane jednym odczytem, pozostałe z plików dziennych.
+    """
+    code = code.upper()
+    start_d, end_d = _as_date(start), _as_date(end)
+    out = []
+    for year in range(start_d.year, end_d.year + 1):
+        archive = _archives.get(year, store.read_year_archive)
+        if archive is not None and code in archive["codes"]:
+            col = archive["codes"].index(code)
+            for dstr, row in zip(archive["dates"], archive["mid"]):
+                d = date.fromisoformat(dstr)
+                if start_d <= d <= end_d and row[col] is not None:
+                    out.append((d, row[col]))
+            continue
+        if archive is not None:
+            # archiwum istnieje, ale waluta nie była notowana w tym roku
+            continue
+        d = max(start_d, date(year, 1, 1))
+        last = min(end_d, date(year, 12, 31))
+        while d <= last:
+            if store.is_publication_day(d):
+                mid = get_rate(d, code)
+                if mid is not None:
+                    out.append((d, mid))
+            d += timedelta(days=1)
+    return out
+
+
+def cache_info():
+    """
+    Liczniki cache tabel dziennych: hits, misses, size, maxsize.
+    """
+    return _tables.info()
+
+
+def clear_cache():
+    global _gold
+    _tables.clear()
+    _tables_c.clear()
+    _archives.clear()
+    _table_b_years.clear()
+    _year_columns.clear()
+    _gold = None
+
+
+# -------------------
+# Indeks dat publikacji ("as-of")
+# -------------------
+
+class DateIndex:
+    """
+    Posortowana lista dat, dla których istnieje tabela; zapytania as-of przez bisect w O(log n).
+    """
+
+    def __init__(self, dates):
+        self.dates = sorted(dates)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def last_on_or_before(self, d: date, strict: bool = False) -> Optional[date]:
+        pos = bisect.bisect_left(self.dates, d) if strict else bisect.bisect_right(self.dates, d)
+        return self.dates[pos - 1] if pos > 0 else None
+
+
+def _store_signature():
+    """
+    mtime katalogów lat — zmienia się przy dodaniu/usunięciu pliku dziennego.
+    """
+    sig = {}
+    try:
+        names = os.listdir(store.BASE_OUT_DIR)
+    except FileNotFoundError:
+        return sig
+    for name in names:
+        if re.fullmatch(r"\d{4}", name):
+            sig[name] = os.stat(os.path.join(store.BASE_OUT_DIR, name)).st_mtime_ns
+    return sig
+
+
+_date_index = None
+_date_index_lock = threading.Lock()
+_store_sig = None
+_store_checked = 0.0
+_store_lock = threading.Lock()
+
+
+def _check_store(force: bool = False):
+    """
+    Co DATE_INDEX_CHECK_S sekund (force=True: od razu) porównuje mtime katalogów lat. Po zmianie
+    usuwa z cache tabele i archiwa zmienionych lat, wyniki negatywne i indeks dat — długo działający
+    proces widzi nowe dni i korekty bez clear_cache().
+    """
+    global _store_sig, _store_checked, _date_index
+    with _store_lock:
+        now = time.monotonic()
+        if not force and _store_sig is not None and now - _store_checked < DATE_INDEX_CHECK_S:
+            return _store_sig
+        _store_checked = now
+        sig = _store_signature()
+        if _store_sig is not None and sig != _store_sig:
+            years = {int(y) for y in set(sig) | set(_store_sig) if sig.get(y) != _store_sig.get(y)}
+            _tables.discard(lambda d, v: v is None or d.year in years)
+            _tables_c.discard(lambda d, v: v is None or d.year in years)
+            _archives.discard(lambda year, v: year in years)
+            _year_columns.discard(lambda year, v: year in years)
+            with _date_index_lock:
+                _date_index = None
+        _store_sig = sig
+        return sig
+
+
+def load_date_index(refresh: bool = False) -> DateIndex:
+    """
+    Zwraca indeks dat z pamięci, z DATE_INDEX_PATH (jeśli aktualny) albo buduje go skanując katalogi lat.
+    Indeks jest budowany od nowa, gdy zmienią się katalogi lat (_check_store; refresh=True sprawdza od razu).
+    """
+    global _date_index
+    sig = _check_store(force=refresh)
+    with _date_index_lock:
+        if _date_index is not None:
+            return _date_index
+        try:
+            with open(DATE_INDEX_PATH, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("signature") == sig:
+                _date_index = DateIndex(date.fromisoformat(x) for x in cached["dates"])
+                return _date_index
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        _date_index = DateIndex(store.scan_store())
+        try:
+            with open(DATE_INDEX_PATH, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"signature": sig, "dates": [d.isoformat() for d in _date_index.dates]},
+                    f, separators=(",", ":"),
+                )
+        except OSError as e:
+            print("⚠ Nie udało się zapisać indeksu dat:", e, file=sys.stderr)
+        return _date_index
+
+
+def last_published_date(d: DateLike, strict: bool = False) -> Optional[date]:
+    """
+    Ostatni dzień z tabelą na dzień d lub wcześniej (strict=True: ściśle przed d).
+    """
+    return load_date_index().last_on_or_before(_as_date(d), strict)
+
+
+def _load_table_b_year(year: int):
+    data = store.read_table_b_year(year)
+    return sorted(data["tables"]), data["tables"]
+
+
+def get_rate_b_asof(d: DateLike, code: str, strict: bool = False):
+    """
+    Zwraca (data_tabeli, mid) z ostatniej tabeli B na dzień d lub wcześniej, w której występuje code,
+    albo None. Tabele B leżą w plikach lat, więc przeszukanie roku to jeden odczyt.
+    """
+    d, code = _as_date(d), code.upper()
+    key = d.isoformat()
+    for year in range(d.year, FIRST_YEAR - 1, -1):
+        dates, tables = _table_b_years.get(year, _load_table_b_year)
+        pos = bisect.bisect_left(dates, key) if strict else bisect.bisect_right(dates, key)
+        while pos > 0:
+            pos -= 1
+            mid = tables[dates[pos]].get(code)
+            if mid is not None:
+                return date.fromisoformat(dates[pos]), mid
+    return None
+
+
+def get_rate_asof(d: DateLike, code: str, strict: bool = False, table_b: bool = True):
+    """
+    Zwraca (data_tabeli, mid) z ostatniej tabeli na dzień d lub wcześniej, w której występuje code,
+    albo None. Dla reguły "dzień roboczy poprzedzający" użyj strict=True.
+    Gdy ostatnia tabela A nie notuje waluty, a table_b=True, kurs pochodzi z ostatniej tabeli B.
+    """
+    index = load_date_index()
+    pos = bisect.bisect_left(index.dates, _as_date(d)) if strict else bisect.bisect_right(index.dates, _as_date(d))
+    if pos > 0:
+        mid = get_rate(index.dates[pos - 1], code)
+        if mid is not None:
+            return index.dates[pos - 1], mid
+        pos -= 1
+    if table_b:
+        found = get_rate_b_asof(d, code, strict)
+        if found is not None:
+            return found
+    if pos == 0:
+        return None
+    # waluta nie była notowana w ostatniej tabeli — szukamy po kolumnach lat, w których występuje
+    return _last_quote_before(code.upper(), index.dates[pos])
+
+
+_year_columns = TableCache(32)
+_code_years = None
+_code_years_lock = threading.Lock()
+
+
+def _load_year_columns(year: int):
+    """
+    (daty, {kod: kursy}) roku — kolumny z archiwum rocznego (albo z plików dziennych, gdy go brak).
+    """
+    codes, rows = _iter_year_rows(year)
+    dates = [d for d, _ in rows]
+    return dates, {c: [row[j] for _, row in rows] for j, c in enumerate(codes)}
+
+
+def code_years():
+    """
+    Indeks kod -> posortowane lata, w których waluta miała kurs; budowany raz na indeks dat.
+    """
+    global _code_years
+    index = load_date_index()
+    with _code_years_lock:
+        if _code_years is None or _code_years[0] is not index:
+            years = {}
+            for year in sorted({d.year for d in index.dates}):
+                _, columns = _year_columns.get(year, _load_year_columns)
+                for c, values in columns.items():
+                    if any(v is not None for v in values):
+                        years.setdefault(c, []).append(year)
+            _code_years = (index, years)
+        return _code_years[1]
+
+
+def _last_quote_before(code: str, before: date):
+    """
+    (data, mid) ostatniego kursu code ściśle przed before albo None — bisect w każdym roku,
+    bez dekodowania kolejnych plików dziennych; kod nigdy nienotowany kończy od razu.
+    """
+    for year in reversed(code_years().get(code, [])):
+        if year > before.year:
+            continue
+        dates, columns = _year_columns.get(year, _load_year_columns)
+        values = columns.get(code, [])
+        for i in range(bisect.bisect_left(dates, before) - 1, -1, -1):
+            if values[i] is not None:
+                return dates[i], values[i]
+    return None
+
+
+# -------------------
+# Ceny złota
+# -------------------
+
+_gold = None
+
+
+def _gold_series():
+    global _gold
+    if _gold is None:
+        series = store.read_gold_series()
+        _gold = (sorted(series), series)
+    return _gold
+
+
+def get_gold_price(d: DateLike, asof: bool = False) -> Optional[float]:
+    """
+    Cena 1 g złota z dnia d (asof=True: z ostatniego notowania na dzień d lub wcześniej) albo None.
+    """
+    dates, series = _gold_series()
+    d = _as_date(d)
+    if not asof:
+        return series.get(d)
+    pos = bisect.bisect_right(dates, d)
+    return series[dates[pos - 1]] if pos > 0 else None
+
+
+def get_gold_series(start: DateLike, end: DateLike):
+    """
+    Lista (date, cena) w zakresie [start, end] — cała historia jest wczytywana jednym odczytem.
+    """
+    dates, series = _gold_series()
+    lo = bisect.bisect_left(dates, _as_date(start))
+    hi = bisect.bisect_right(dates, _as_date(end))
+    return [(d, series[d]) for d in dates[lo:hi]]
+
+
+# -------------------
+# Konwersja wsadowa
+# -------------------
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class RateGrid:
+    """
+    Gęsta macierz kursów: wiersz na każdy dzień kalendarzowy od start, kolumna na walutę.
+    Wartości są przeniesione w przód (forward-fill), więc wiersz dnia d zawiera kurs
+    z ostatniej tabeli na dzień d lub wcześniej — zapytanie as-of to zwykłe indeksowanie.
+    values to numpy.ndarray (float64, NaN = brak) albo lista list, gdy numpy nie jest dostępny.
+    """
+
+    def __init__(self, start: date, codes, values):
+        self.start = start
+        self.codes = list(codes)
+        self.col = {c: i for i, c in enumerate(self.codes)}
+        self.values = values
+        self.n_days = len(values)
+        self._extended = None
+        # (base, quote) -> kolumna kursów krzyżowych dla wszystkich dni siatki
+        self.pairs = {}
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=self.n_days - 1)
+
+    def extended_values(self):
+        """
+        values z dwiema dodatkowymi kolumnami (numpy): jedynki dla PLN i NaN dla nieznanych kodów.
+        """
+        if self._extended is None:
+            self._extended = np.hstack([
+                self.values, np.ones((self.n_days, 1)), np.full((self.n_days, 1), np.nan)
+            ])
+        return self._extended
+
+
+def _iter_year_rows(year: int):
+    """
+    Zwraca (codes, [(date, row)]) dla roku — z archiwum rocznego albo z plików dziennych.
+    """
+    archive = _archives.get(year, store.read_year_archive)
+    if archive is not None:
+        return archive["codes"], [(date.fromisoformat(d), row) for d, row in zip(archive["dates"], archive["mid"])]
+    index = load_date_index()
+    codes, rows = [], []
+    lo = bisect.bisect_left(index.dates, date(year, 1, 1))
+    hi = bisect.bisect_right(index.dates, date(year, 12, 31))
+    for d in index.dates[lo:hi]:
+        table = get_table(d)
+        if not table:
+            continue
+        mids = {r.get("code"): r.get("mid") for r in table.get("rates", [])}
+        for c in mids:
+            if c not in codes:
+                codes.append(c)
+        rows.append((d, mids))
+    return codes, [(d, [m.get(c) for c in codes]) for d, m in rows]
+
+
+def load_rate_grid(start: Optional[DateLike] = None, end: Optional[DateLike] = None) -> RateGrid:
+    """
+    Buduje RateGrid z magazynu (archiwa roczne, w razie ich braku pliki dzienne).
+    """
+    index = load_date_index()
+    if not index.dates:
+        raise ValueError("magazyn kursów jest pusty")
+    start_d = _as_date(start) if start else index.dates[0]
+    end_d = _as_date(end) if end else index.dates[-1]
+    n_days = (end_d - start_d).days + 1
+
+    columns = {}
+    for year in range(start_d.year, end_d.year + 1):
+        codes, rows = _iter_year_rows(year)
+        for d, row in rows:
+            if not start_d <= d <= end_d:
+                continue
+            idx = (d - start_d).days
+            for c, v in zip(codes, row):
+                if v is not None:
+                    columns.setdefault(c, {})[idx] = float(v)
+    codes = sorted(columns)
+
+    # wartość sprzed początku zakresu, żeby pierwsze dni też miały kurs as-of (siatka to tylko tabela A)
+    for c in codes:
+        if 0 not in columns[c]:
+            found = get_rate_asof(start_d, c, table_b=False)
+            if found is not None:
+                columns[c][0] = float(found[1])
+
+    nan = float("nan")
+    values = [[nan] * len(codes) for _ in range(n_days)]
+    for j, c in enumerate(codes):
+        col = columns[c]
+        last = nan
+        for i in range(n_days):
+            last = col.get(i, last)
+            values[i][j] = last
+    if np is not None:
+        values = np.array(values, dtype=np.float64).reshape(n_days, len(codes))
+    grid = RateGrid(start_d, codes, values)
+    precompute_pairs(HOT_PAIRS, grid)
+    return grid
+
+
+_grid = None
+_grid_index = None
+
+
+def get_rate_grid(refresh: bool = False) -> RateGrid:
+    """
+    Wspólna, leniwie budowana RateGrid dla całego magazynu; przebudowywana, gdy zmieni się indeks dat.
+    """
+    global _grid, _grid_index
+    index = load_date_index()
+    if _grid is None or refresh or _grid_index is not index:
+        _grid = load_rate_grid()
+        _grid_index = index
+    return _grid
+
+
+def _ordinals(dates):
+    if np is not None and isinstance(dates, np.ndarray) and np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+    ords = [_as_date(d).toordinal() for d in dates]
+    return np.asarray(ords, dtype=np.int64) if np is not None else ords
+
+
+def convert_to_pln(dates, codes, amounts, strict: bool = False, grid: Optional[RateGrid] = None):
+    """
+    Przelicza kwoty na PLN po kursie as-of: amount * mid z ostatniej tabeli na dzień
+    transakcji lub wcześniej (strict=True: z tabeli ściśle przed dniem transakcji).
+    dates: daty / napisy ISO / numpy datetime64, codes: kody walut ("PLN" = 1), amounts: kwoty.
+    Daty po ostatniej tabeli siatki (weekend, święto, dziś przed fixingiem) dostają kurs z ostatniego
+    wiersza — jak get_rate_asof. Zwraca numpy.ndarray (gdy numpy jest dostępny) albo listę; NaN gdy kursu brak.
+    """
+    grid = grid or get_rate_grid()
+    shift = 1 if strict else 0
+    start_ord = grid.start.toordinal()
+    col = dict(grid.col)
+
+    if np is None:
+        out = []
+        for o, c, a in zip(_ordinals(dates), codes, amounts):
+            c = str(c).upper()
+            if c == "PLN":
+                out.append(float(a))
+                continue
+            i = min(o - start_ord - shift, grid.n_days - 1)
+            j = col.get(c)
+            if j is None or i < 0:
+                out.append(float("nan"))
+            else:
+                out.append(float(a) * grid.values[i][j])
+        return out
+
+    rows = np.minimum(_ordinals(dates) - start_ord - shift, grid.n_days - 1)
+    uniq, inverse = np.unique(np.asarray(codes).astype(str), return_inverse=True)
+    values = grid.extended_values()
+    pln_col, missing_col = len(grid.codes), len(grid.codes) + 1
+    lookup = np.array([
+        pln_col if u.upper() == "PLN" else col.get(u.upper(), missing_col) for u in uniq
+    ], dtype=np.int64)
+    cols = lookup[inverse.reshape(-1)]
+    valid = rows >= 0
+    rates = np.full(rows.shape, np.nan)
+    rates[valid] = values[rows[valid], cols[valid]]
+    # PLN = 1 także poza zakresem siatki (jak w ścieżce bez numpy)
+    rates[cols == pln_col] = 1.0
+    return rates * np.asarray(amounts, dtype=np.float64)
+
+
+def verify_grid(dates, codes, strict: bool = False, grid: Optional[RateGrid] = None):
+    """
+    Porównuje convert_to_pln (kwota 1) z get_rate_asof dla każdej pary (data, kod).
+    Zwraca listę rozbieżności [(data, kod, z siatki, as-of)]; pusta lista = zgodne.
+    """
+    grid = grid or get_rate_grid()
+    got = convert_to_pln(dates, codes, [1.0] * len(codes), strict=strict, grid=grid)
+    mismatches = []
+    for d, c, g in zip(dates, codes, got):
+        d, c, g = _as_date(d), str(c).upper(), float(g)
+        if c == "PLN":
+            expected = 1.0
+        else:
+            found = get_rate_asof(d, c, strict=strict, table_b=False)
+            expected = float(found[1]) if found else float("nan")
+        if not (g == expected or (g != g and expected != expected)):
+            mismatches.append((d, c, g, expected))
+    return mismatches
+
+
+# -------------------
+# Kursy krzyżowe
+# -------------------
+
+def _split_pair(pair):
+    base, _, quote = pair.partition("/")
+    return base.strip().upper(), quote.strip().upper()
+
+
+def _pln_column(grid: RateGrid, code: str):
+    """
+    Kolumna kursów code/PLN z siatki (PLN -> same jedynki, nieznany kod -> None).
+    """
+    if code == "PLN":
+        return np.ones(grid.n_days) if np is not None else [1.0] * grid.n_days
+    j = grid.col.get(code)
+    if j is None:
+        return None
+    return grid.values[:, j] if np is not None else [row[j] for row in grid.values]
+
+
+def pair_column(grid: RateGrid, base: str, quote: str):
+    """
+    Kurs base/quote (ile quote za 1 base) dla każdego dnia siatki — jedno dzielenie kolumn.
+    """
+    base, quote = base.upper(), quote.upper()
+    cached = grid.pairs.get((base, quote))
+    if cached is not None:
+        return cached
+    b, q = _pln_column(grid, base), _pln_column(grid, quote)
+    if b is None or q is None:
+        raise KeyError(f"nieznana waluta w parze {base}/{quote}")
+    if np is not None:
+        return b / q
+    return [x / y if y == y and y != 0 else float("nan") for x, y in zip(b, q)]
+
+
+def precompute_pairs(pairs, grid: Optional[RateGrid] = None):
+    """
+    Liczy z góry kolumny kursów dla par ("EUR/USD" lub (base, quote)) i zapamiętuje je w siatce.
+    Pary z nieznanymi walutami są pomijane.
+    """
+    grid = grid or get_rate_grid()
+    for pair in pairs:
+        base, quote = _split_pair(pair) if isinstance(pair, str) else (pair[0].upper(), pair[1].upper())
+        try:
+            grid.pairs[(base, quote)] = pair_column(grid, base, quote)
+        except KeyError as e:
+            print("⚠", e.args[0], file=sys.stderr)
+    return grid
+
+
+def cross_rate(d: DateLike, base: str, quote: str, asof: bool = False, table_b: bool = False) -> Optional[float]:
+    """
+    Kurs base/quote w dniu d wyliczony z kursów średnich tabeli A (np. EUR/USD = mid EUR / mid USD).
+    asof=True używa ostatniej tabeli na dzień d lub wcześniej; table_b=True (tylko z asof) dopuszcza
+    kurs z tabeli B dla walut, których ostatnia tabela A nie notuje.
+    """
+    def mid(code):
+        if code.upper() == "PLN":
+            return 1.0
+        if asof:
+            found = get_rate_asof(d, code, table_b=table_b)
+            return found[1] if found else None
+        return get_rate(d, code)
+
+    b, q = mid(base), mid(quote)
+    if b is None or not q:
+        return None
+    return b / q
+
+
+def cross_series(base: str, quote: str, start: DateLike, end: DateLike, grid: Optional[RateGrid] = None):
+    """
+    Kursy base/quote dla dni publikacji w [start, end] jako (daty, wartości);
+    wartości to numpy.ndarray albo lista. Gorące pary są brane z cache siatki.
+    """
+    grid = grid or get_rate_grid()
+    column = pair_column(grid, base, quote)
+    index = load_date_index()
+    lo = bisect.bisect_left(index.dates, max(_as_date(start), grid.start))
+    hi = bisect.bisect_right(index.dates, min(_as_date(end), grid.end))
+    dates = index.dates[lo:hi]
+    start_ord = grid.start.toordinal()
+    if np is not None:
+        rows = np.fromiter((d.toordinal() - start_ord for d in dates), dtype=np.int64, count=len(dates))
+        return dates, column[rows]
+    return dates, [column[d.toordinal() - start_ord] for d in dates]
+
+
+# -------------------
+# CLI
+# -------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Odczyt kursów NBP z magazynu docs/exc")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rate = sub.add_parser("rate", help="kurs z tabeli danego dnia")
+    p_rate.add_argument("date", type=date.fromisoformat)
+    p_rate.add_argument("code")
+    p_bidask = sub.add_parser("bidask", help="kurs kupna/sprzedaży z tabeli C danego dnia")
+    p_bidask.add_argument("date", type=date.fromisoformat)
+    p_bidask.add_argument("code")
+    p_asof = sub.add_parser("asof", help="kurs z ostatniej tabeli na dzień lub przed nim")
+    p_asof.add_argument("date", type=date.fromisoformat)
+    p_asof.add_argument("code")
+    p_asof.add_argument("--strict", action="store_true", help="tabela ściśle przed podaną datą")
+    p_series = sub.add_parser("series", help="szereg kursów w zakresie dat")
+    p_series.add_argument("code")
+    p_series.add_argument("start", type=date.fromisoformat)
+    p_series.add_argument("end", type=date.fromisoformat)
+    p_verify = sub.add_parser("verify", help="zgodność konwersji wsadowej z get_rate_asof dla zakresu dat")
+    p_verify.add_argument("start", type=date.fromisoformat)
+    p_verify.add_argument("end", type=date.fromisoformat)
+    p_verify.add_argument("codes", nargs="*", default=["EUR", "USD", "CHF", "PLN"])
+    p_gold = sub.add_parser("gold", help="cena złota z danego dnia")
+    p_gold.add_argument("date", type=date.fromisoformat)
+    p_gold.add_argument("--asof", action="store_true", help="ostatnie notowanie na dzień lub przed nim")
+    p_cross = sub.add_parser("cross", help="kurs krzyżowy pary, np. EUR/USD")
+    p_cross.add_argument("date", type=date.fromisoformat)
+    p_cross.add_argument("pair")
+    p_cross.add_argument("--asof", action="store_true", help="ostatnia tabela na dzień lub przed nim")
+    p_cross.add_argument("--table-b", action="store_true", help="z --asof: dopuszcza kursy z tabeli B")
+    args = parser.parse_args(argv)
+
+    if args.command == "rate":
+        mid = get_rate(args.date, args.code)
+        if mid is None:
+            print(f"Brak kursu {args.code.upper()} na {args.date.isoformat()}", file=sys.stderr)
+            return 1
+        print(f"{args.date.isoformat()} {args.code.upper()} {mid}")
+    elif args.command == "bidask":
+        found = get_bid_ask(args.date, args.code)
+        if found is None:
+            print(f"Brak kursu kupna/sprzedaży {args.code.upper()} na {args.date.isoformat()}", file=sys.stderr)
+            return 1
+        print(f"{args.date.isoformat()} {args.code.upper()} {found[0]} {found[1]}")
+    elif args.command == "asof":
+        found = get_rate_asof(args.date, args.code, strict=args.strict)
+        if found is None:
+            print(f"Brak kursu {args.code.upper()} na {args.date.isoformat()} ani wcześniej", file=sys.stderr)
+            return 1
+        print(f"{found[0].isoformat()} {args.code.upper()} {found[1]}")
+    elif args.command == "series":
+        for d, mid in get_series(args.code, args.start, args.end):
+            print(f"{d.isoformat()} {mid}")
+    elif args.command == "verify":
+        n = (args.end - args.start).days + 1
+        dates = [args.start + timedelta(days=i) for i in range(n) for _ in args.codes]
+        codes = [c.upper() for _ in range(n) for c in args.codes]
+        mismatches = verify_grid(dates, codes) + verify_grid(dates, codes, strict=True)
+        for d, c, g, e in mismatches:
+            print(f"{d.isoformat()} {c}: siatka {g}, as-of {e}", file=sys.stderr)
+        print(f"Sprawdzono {2 * len(dates)} par, rozbieżności: {len(mismatches)}")
+        return 1 if mismatches else 0
+    elif args.command == "gold":
+        price = get_gold_price(args.date, asof=args.asof)
+        if price is None:
+            print(f"Brak ceny złota na {args.date.isoformat()}", file=sys.stderr)
+            return 1
+        print(f"{args.date.isoformat()} {price}")
+    elif args.command == "cross":
+        base, quote = _split_pair(args.pair)
+        value = cross_rate(args.date, base, quote, asof=args.asof, table_b=args.table_b)
+        if value is None:
+            print(f"Brak kursu {base}/{quote} na {args.date.isoformat()}", file=sys.stderr)
+            return 1
+        print(f"{args.date.isoformat()} {base}/{quote} {value:.6f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
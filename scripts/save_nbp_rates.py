@@ -7,8 +7,9 @@
 
 from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
-import urllib.request
 import urllib.error
+import http.client
+import io
 import json
 import os
 import sys
@@ -18,11 +19,43 @@ import gzip
 import hashlib
 import shutil
 import re
+import zlib
+import math
+import mmap
+import struct
+import argparse
+import functools
+import threading
+import queue
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+from urllib.parse import urlsplit
 from typing import Optional
 
 TZ = "Europe/Warsaw"
 
-BASE_OUT_DIR = os.path.join("docs", "exc")
+# Katalog magazynu; NBP_OUT_DIR pozwala wskazać go np. przy imporcie z innego katalogu roboczego
+BASE_OUT_DIR = os.getenv("NBP_OUT_DIR", os.path.join("docs", "exc"))
+
+# Tabele NBP i ich drzewa: A (kursy średnie) w BASE_OUT_DIR, C (kupno/sprzedaż) obok, w docs/exc_c,
+# B (waluty egzotyczne, raz w tygodniu) w docs/exc_b — jeden plik na rok zamiast pliku na dzień.
+# Pliki stanu (dziennik backfilla, .no_table, .digests.json, marker) każda tabela ma we własnym drzewie.
+TABLE_DIRS = {
+    "A": BASE_OUT_DIR,
+    "B": os.getenv("NBP_B_OUT_DIR", BASE_OUT_DIR + "_b"),
+    "C": os.getenv("NBP_C_OUT_DIR", BASE_OUT_DIR + "_c"),
+}
+# Ceny złota NBP (cenyzlota): jeden plik CSV "data,cena" dla całej historii (od 2013-01-02),
+# pobierany zakresami do GOLD_CHUNK_DAYS dni
+GOLD_PATH = os.getenv("NBP_GOLD_PATH", BASE_OUT_DIR + "_gold.csv")
+# Dni publikacji bez ceny złota (odpowiednik .no_table), żeby sync nie pytał o nie ponownie
+GOLD_NO_PRICE_FILE = os.path.splitext(GOLD_PATH)[0] + ".no_price"
+GOLD_START = date(2013, 1, 2)
+GOLD_CHUNK_DAYS = 367
+# Zbiory danych obsługiwane w jednym przebiegu (tabele A/B/C i ceny złota), np. NBP_DATASETS=A,B,C,GOLD
+DATASET_NAMES = ("A", "B", "C", "GOLD")
+DATASETS = [x for x in (t.strip().upper() for t in os.getenv("NBP_DATASETS", "A").split(",")) if x in DATASET_NAMES]
 
 # Domyślny rok startowy: 2002. Nadpisz przez START_YEAR w env, np. START_YEAR=2010
 START_YEAR = int(os.getenv("START_YEAR", "2002"))
@@ -30,20 +63,93 @@ START_DATE = date(START_YEAR, 1, 1)
 
 CHUNK_DAYS = 93
 
+# Równoległy backfill: liczba wątków pobierających zakresy (1 = tryb sekwencyjny)
+# oraz limit jednoczesnych połączeń do jednego hosta (api.nbp.pl).
+BACKFILL_WORKERS = max(1, int(os.getenv("BACKFILL_WORKERS", "4")))
+HTTP_MAX_PER_HOST = max(1, int(os.getenv("HTTP_MAX_PER_HOST", "4")))
+# Po ilu sekundach bezczynności połączenie keep-alive jest zamykane zamiast ponownie użyte
+HTTP_IDLE_TIMEOUT = float(os.getenv("HTTP_IDLE_TIMEOUT", "30"))
+# Globalny limit zapytań do API dla wszystkich zbiorów danych (zapytań/s, token bucket; 0 = bez limitu)
+HTTP_RATE_LIMIT = float(os.getenv("HTTP_RATE_LIMIT", "10"))
+# Ile zadań zapisu może czekać na etap zapisu, zanim wątki pobierające zostaną wstrzymane
+WRITE_QUEUE_SIZE = max(1, int(os.getenv("WRITE_QUEUE_SIZE", "16")))
+# WRITE_FSYNC=1: fsync plików przed rename i jeden fsync katalogu na koniec paczki zapisów
+WRITE_FSYNC = os.getenv("WRITE_FSYNC", "0") == "1"
+# Liczba procesów kompresujących (json.dumps + gzip) przy backfillu/normalizacji; 0 = w wątku głównym
+COMPRESS_WORKERS = max(0, int(os.getenv("COMPRESS_WORKERS", "0")))
+
+# Format nowych plików dziennych: "gz" (.json.gz) albo "zd" (.json.zd — deflate ze wspólnym słownikiem zlib)
+STORE_FORMAT = os.getenv("STORE_FORMAT", "gz")
+DAILY_EXTS = {"gz": ".json.gz", "zd": ".json.zd"}
+STORE_EXT = DAILY_EXTS.get(STORE_FORMAT, ".json.gz")
+# Treść nowych plików dziennych: "full" ({"date","rates":[...]}) albo "slim" ({"date","mid":{kod: kurs}}),
+# w której nazwy walut są tylko w CURRENCIES_FILE
+PAYLOAD_FORMAT = os.getenv("PAYLOAD_FORMAT", "full")
+
 BACKFILL_MARKER = os.path.join(BASE_OUT_DIR, ".backfill_done")
+# Stary log (linia na każdy wpis) — jednorazowo kompaktowany do RUN_LEDGER
 LAST_MARKER = os.path.join(BASE_OUT_DIR, ".last")
+# Linie .last odległe o mniej niż tyle sekund należą do jednego przebiegu
+LEGACY_RUN_GAP_S = 300
+# Dziennik przebiegów: jeden rekord JSON na przebieg, trzymane ostatnie LEDGER_MAX_RUNS
+# (rekordy "legacy" ze skompaktowanego .last nie podlegają rotacji)
+RUN_LEDGER = os.path.join(BASE_OUT_DIR, ".runs.jsonl")
+LEDGER_MAX_RUNS = max(1, int(os.getenv("LEDGER_MAX_RUNS", "200")))
+# Dziennik ukończonych zakresów backfilla (JSON lines, tylko dopisywanie)
+BACKFILL_JOURNAL = os.path.join(BASE_OUT_DIR, ".backfill_journal")
+# Dni robocze, dla których NBP potwierdził brak tabeli (pomijane przez sync)
+NO_TABLE_FILE = os.path.join(BASE_OUT_DIR, ".no_table")
+# Skróty (sha256) kanonicznej treści plików dziennych: data -> digest
+DIGEST_MANIFEST = os.path.join(BASE_OUT_DIR, ".digests.json")
+# Wersjonowana tabela walut: kod -> nazwy z przedziałami ważności (NBP zmienia czasem nazwy)
+CURRENCIES_FILE = os.path.join(BASE_OUT_DIR, "currencies.json")
+# Katalog plików dla strony i klientów (zamiast GitHub tree API)
+WEB_MANIFEST = os.path.join(BASE_OUT_DIR, "manifest.json")
+# Roczne archiwa (macierz daty × waluty) budowane z plików dziennych
+ARCHIVE_DIR = os.path.join(BASE_OUT_DIR, "_years")
+
+# Binarna macierz kursów (mmap) — lokalna pamięć podręczna poza repozytorium (.gitignore),
+# tworzona na żądanie komendą "bin", potem dopisywana przy każdym przebiegu
+RATES_BIN_PATH = os.getenv("RATES_BIN_PATH", os.path.join(BASE_OUT_DIR, "rates.bin"))
+
+# Statyczne API (GitHub Pages): szeregi czasowe per waluta
+API_DIR = os.getenv("NBP_API_DIR", os.path.join("docs", "api"))
+SERIES_DIR = os.path.join(API_DIR, "series")
+
+# Słowniki zlib (zdict) dla formatu .json.zd: <id>.bin + plik "current" z id bieżącego
+ZDICT_DIR = os.path.join(BASE_OUT_DIR, "_zdict")
+ZDICT_SIZE = 32 * 1024
+
+# Katalogi z danymi pochodnymi — nie są katalogami legacy do migracji
+DERIVED_DIRS = {os.path.basename(ARCHIVE_DIR), os.path.basename(ZDICT_DIR)}
 
 BASE_TABLE_URL = (
-    "https://api.nbp.pl/api/exchangerates/tables/A/"
+    "https://api.nbp.pl/api/exchangerates/tables/{table}/"
     "{start}/{end}/?format=json"
 )
 SINGLE_DAY_URL = (
-    "https://api.nbp.pl/api/exchangerates/tables/A/"
+    "https://api.nbp.pl/api/exchangerates/tables/{table}/"
     "{date}/?format=json"
 )
+GOLD_URL = (
+    "https://api.nbp.pl/api/cenyzlota/"
+    "{start}/{end}/?format=json"
+)
+# Szybka ścieżka dziennego przebiegu: ostatnie n tabel albo tabela z dzisiaj
+LAST_TABLES_URL = (
+    "https://api.nbp.pl/api/exchangerates/tables/{table}/"
+    "last/{n}/?format=json"
+)
+TODAY_TABLE_URL = (
+    "https://api.nbp.pl/api/exchangerates/tables/{table}/"
+    "today/?format=json"
+)
+# Powyżej tylu brakujących dni publikacji szybka ścieżka oddaje pracę do sync (zakresy po CHUNK_DAYS)
+LAST_TABLES_MAX = 60
 
 HEADERS = {
-    "User-Agent": "nbp-exchange-rates-fetcher/1.0"
+    "User-Agent": "nbp-exchange-rates-fetcher/1.0",
+    "Accept-Encoding": "gzip",
 }
 
 # -------------------
@@ -54,24 +160,365 @@ def ensure_base_dir():
     os.makedirs(BASE_OUT_DIR, exist_ok=True)
 
 
-def append_last_marker(path):
+def table_dir(table: str = "A"):
+    return TABLE_DIRS[table]
+
+
+def table_file(table: str, path_a: str):
+    """
+    Odpowiednik pliku stanu path_a (ścieżka dla tabeli A) w drzewie tabeli table.
+    """
+    if table == "A":
+        return path_a
+    return os.path.join(table_dir(table), os.path.basename(path_a))
+
+
+class RunLedger:
+    """
+    Zbiera w pamięci statystyki jednego przebiegu (liczniki, czasy faz, zapisane ścieżki)
+    i zapisuje je jednym rekordem do RUN_LEDGER na końcu przebiegu.
+    """
+
+    def __init__(self):
+        self.started = datetime.now(ZoneInfo(TZ))
+        self._t0 = time.monotonic()
+        self.counts = {"written": 0, "corrected": 0, "skipped": 0, "failed": 0}
+        self.phases = {}
+        self.written_paths = []
+        # zbiór danych, którego zadanie wykonuje teraz etap zapisu (liczniki per zbiór)
+        self.dataset = None
+        self.datasets = {}
+
+    def _dataset_stats(self, name: str):
+        return self.datasets.setdefault(name, {"fetch_s": 0.0, "write_s": 0.0, "counts": {}})
+
+    def record(self, status: str, path: Optional[str] = None):
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if self.dataset:
+            counts = self._dataset_stats(self.dataset)["counts"]
+            counts[status] = counts.get(status, 0) + 1
+        # plik zbiorczy (rok tabeli B, szereg złota) z wieloma dniami trafia na listę raz
+        if path and status in ("written", "corrected") and path.replace(os.sep, "/") not in self.written_paths[-1:]:
+            self.written_paths.append(path.replace(os.sep, "/"))
+
+    def phase(self, name: str):
+        ledger = self
+
+        class _Phase:
+            def __enter__(self):
+                self.t0 = time.monotonic()
+
+            def __exit__(self, *exc):
+                ledger.phases[name] = round(ledger.phases.get(name, 0) + time.monotonic() - self.t0, 3)
+
+        return _Phase()
+
+    def add_time(self, name: str, kind: str, seconds: float):
+        stats = self._dataset_stats(name)
+        stats[kind] = round(stats[kind] + seconds, 3)
+
+    def to_record(self, command: str):
+        return {
+            "start": self.started.isoformat(timespec="seconds"),
+            "duration_s": round(time.monotonic() - self._t0, 3),
+            "command": command,
+            "counts": self.counts,
+            "phases": self.phases,
+            "datasets": self.datasets,
+            "written": self.written_paths,
+        }
+
+    def flush(self, command: str):
+        """
+        Dopisuje rekord przebiegu i rotuje dziennik do LEDGER_MAX_RUNS rekordów (jeden zapis atomowy).
+        """
+        lines = []
+        try:
+            with open(RUN_LEDGER, "r", encoding="utf-8") as f:
+                lines = [line for line in f.read().splitlines() if line.strip()]
+        except FileNotFoundError:
+            pass
+        lines.append(json.dumps(self.to_record(command), ensure_ascii=False, separators=(",", ":")))
+        lines = rotate_ledger(lines)
+        tmp_path = RUN_LEDGER + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, RUN_LEDGER)
+        except Exception as e:
+            print("❌ Błąd zapisu", RUN_LEDGER, ":", e)
+        c = self.counts
+        print(
+            f"📒 Przebieg: zapisane {c['written']}, skorygowane {c['corrected']}, pominięte {c['skipped']}, "
+            f"błędy {c['failed']} ({time.monotonic() - self._t0:.1f}s)"
+        )
+
+
+LEDGER = RunLedger()
+
+
+def _is_legacy_record(line: str) -> bool:
+    try:
+        return json.loads(line).get("command") == "legacy"
+    except (ValueError, AttributeError):
+        return False
+
+
+def rotate_ledger(lines):
+    """
+    Zostawia wszystkie rekordy "legacy" (historia z .last) i ostatnie LEDGER_MAX_RUNS pozostałych.
+    """
+    legacy = [line for line in lines if _is_legacy_record(line)]
+    runs = [line for line in lines if not _is_legacy_record(line)]
+    return legacy + runs[-LEDGER_MAX_RUNS:]
+
+
+def compact_last_marker():
+    """
+    Jednorazowo zamienia stary log .last (linia na wpis) na rekordy RUN_LEDGER —
+    po jednym na przebieg (linie odległe o mniej niż LEGACY_RUN_GAP_S) z liczbą wpisów — i usuwa .last.
+    """
+    if not os.path.exists(LAST_MARKER):
+        return
+    stamps = []
+    try:
+        with open(LAST_MARKER, "r", encoding="utf-8") as f:
+            for line in f:
+                ts, sep, _ = line.partition(": ")
+                if not sep:
+                    continue
+                try:
+                    stamps.append(datetime.strptime(ts.strip(), "%Y-%m-%d %H:%M:%S"))
+                except ValueError:
+                    pass
+    except Exception as e:
+        print("⚠ Nie udało się odczytać", LAST_MARKER, ":", e)
+        return
+    # [początek, koniec, liczba wpisów] — przebieg zapisywał pliki przez wiele sekund
+    runs = []
+    for ts in sorted(stamps):
+        if runs and (ts - runs[-1][1]).total_seconds() < LEGACY_RUN_GAP_S:
+            runs[-1][1] = ts
+            runs[-1][2] += 1
+        else:
+            runs.append([ts, ts, 1])
+    existing = []
+    if os.path.exists(RUN_LEDGER):
+        with open(RUN_LEDGER, "r", encoding="utf-8") as f:
+            existing = [line for line in f.read().splitlines() if line.strip()]
+    legacy = [
+        json.dumps({"start": start.isoformat(), "end": end.isoformat(), "command": "legacy",
+                    "counts": {"entries": n}}, separators=(",", ":"))
+        for start, end, n in runs
+    ]
+    lines = rotate_ledger(legacy + existing)
     try:
-        os.makedirs(os.path.dirname(LAST_MARKER), exist_ok=True)
-        with open(LAST_MARKER, "a", encoding="utf-8") as f:
-            now_str = datetime.now(ZoneInfo(TZ)).strftime("%Y-%m-%d %H:%M:%S")
-            f.write(f"{now_str}: {path}\n")
+        with open(RUN_LEDGER + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(RUN_LEDGER + ".tmp", RUN_LEDGER)
+        os.remove(LAST_MARKER)
+        print(f"🗜 Skompaktowano {LAST_MARKER} ({len(runs)} przebiegów) do {RUN_LEDGER}")
     except Exception as e:
-        print("❌ Błąd zapisu .last:", e)
+        print("❌ Błąd kompaktowania", LAST_MARKER, ":", e)
+
+
+def path_for_date(d: date, table: str = "A"):
+    """
+    Zwraca ścieżkę docs/exc/<YEAR>/<dd_mm_YYYY><STORE_EXT> (katalog tworzy dopiero zapis).
+    """
+    return os.path.join(table_dir(table), str(d.year), d.strftime("%d_%m_%Y") + STORE_EXT)
+
+
+def daily_ext_priority():
+    """
+    Rozszerzenia plików dziennych od kanonicznego (STORE_EXT) do najstarszego (.json).
+    """
+    return [STORE_EXT] + [e for e in (".json.gz", ".json.zd") if e != STORE_EXT] + [".json"]
+
+
+def find_existing_path(d: date, table: str = "A") -> Optional[str]:
+    """
+    Zwraca ścieżkę istniejącego pliku dnia (w dowolnym formacie) albo None. Nie tworzy katalogów.
+    """
+    base = os.path.join(table_dir(table), str(d.year), d.strftime("%d_%m_%Y"))
+    for ext in daily_ext_priority():
+        if os.path.exists(base + ext):
+            return base + ext
+    return None
+
+
+_known_dirs = set()
+
+
+def ensure_dir(dirn):
+    """
+    os.makedirs tylko przy pierwszym użyciu katalogu w tym procesie.
+    """
+    if dirn not in _known_dirs:
+        os.makedirs(dirn, exist_ok=True)
+        _known_dirs.add(dirn)
+
+
+def encode_json_gz(data) -> bytes:
+    """
+    JSON (kompaktowy, UTF-8) skompresowany gzip. mtime=0 -> ta sama treść daje te same bajty.
+    """
+    payload_bytes = json.dumps(
+        data,
+        ensure_ascii=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+    return gzip.compress(payload_bytes, mtime=0)
+
+
+_compress_pool = None
 
 
-def path_for_date(d: date):
+def get_compress_pool() -> Optional[ProcessPoolExecutor]:
     """
-    Zwraca ścieżkę docs/exc/<YEAR>/<dd_mm_YYYY>.json.gz i tworzy katalog YEAR jeśli potrzeba.
+    Wspólna pula procesów do kompresji (tworzona przy pierwszym użyciu, gdy COMPRESS_WORKERS > 0).
+    spawn zamiast fork — proces ma już wątki HTTP, a fork z wątkami bywa zawodny.
     """
-    year_dir = os.path.join(BASE_OUT_DIR, str(d.year))
-    os.makedirs(year_dir, exist_ok=True)
-    filename = d.strftime("%d_%m_%Y.json.gz")
-    return os.path.join(year_dir, filename)
+    global _compress_pool
+    if _compress_pool is None and COMPRESS_WORKERS > 0:
+        _compress_pool = ProcessPoolExecutor(
+            max_workers=COMPRESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _compress_pool
+
+
+def shutdown_compress_pool():
+    global _compress_pool
+    if _compress_pool is not None:
+        _compress_pool.shutdown()
+        _compress_pool = None
+
+
+def encode_many(payloads, encoder=None):
+    """
+    Koduje listę obiektów (domyślnie daily_encoder()) — w puli procesów, jeśli jest włączona.
+    """
+    encoder = encoder or daily_encoder()
+    pool = get_compress_pool()
+    if pool is None or len(payloads) < 2:
+        return [encoder(p) for p in payloads]
+    return list(pool.map(encoder, payloads, chunksize=max(1, len(payloads) // (4 * COMPRESS_WORKERS))))
+
+
+# -------------------
+# Format .json.zd (zlib z preset dictionary)
+# -------------------
+#
+# Plik: b"NBZ1" + 16 znaków ASCII id słownika + surowy strumień deflate (wbits=-15) ze zdict.
+# Słownik to najczęstsze fragmenty tabel (nazwy i kody walut), więc nawet mały plik
+# nie musi ich kodować od zera. Stare słowniki zostają w ZDICT_DIR, żeby dało się czytać starsze pliki.
+
+ZD_MAGIC = b"NBZ1"
+
+
+def encode_json_zd(data, zdict: bytes, dict_id: str) -> bytes:
+    payload_bytes = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    comp = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=zdict)
+    return ZD_MAGIC + dict_id.encode("ascii") + comp.compress(payload_bytes) + comp.flush()
+
+
+@functools.lru_cache(maxsize=8)
+def load_zdict(dict_id: str) -> bytes:
+    with open(os.path.join(ZDICT_DIR, dict_id + ".bin"), "rb") as f:
+        return f.read()
+
+
+def decode_json_zd(blob: bytes):
+    if blob[:4] != ZD_MAGIC:
+        raise ValueError("nieprawidłowy nagłówek .json.zd")
+    dict_id = blob[4:20].decode("ascii")
+    decomp = zlib.decompressobj(-15, zdict=load_zdict(dict_id))
+    return json.loads((decomp.decompress(blob[20:]) + decomp.flush()).decode("utf-8"))
+
+
+def _rate_fragment(r):
+    # ten sam porządek pól i separatory co w payloadzie z process_table_entry
+    head = '{"currency":' + json.dumps(r["currency"], ensure_ascii=False) + "," if r.get("currency") else "{"
+    return head + '"code":' + json.dumps(r.get("code")) + ',"mid":'
+
+
+def build_zdict(size: int = ZDICT_SIZE) -> Optional[str]:
+    """
+    Buduje słownik zlib z historycznych tabel: fragmenty walut posortowane rosnąco po częstości
+    (zlib najtaniej odwołuje się do końca słownika), ucięte do size bajtów. Zwraca id słownika.
+    """
+    freq = Counter()
+    for name in sorted(os.listdir(BASE_OUT_DIR)):
+        if not re.fullmatch(r"\d{4}", name):
+            continue
+        for path in daily_files_for_year(int(name)).values():
+            data = read_json_from_file(path)
+            if isinstance(data, dict):
+                freq.update(_rate_fragment(r) for r in expand_payload(data)["rates"] if isinstance(r, dict))
+    if not freq:
+        print("⚠ Brak tabel do zbudowania słownika")
+        return None
+    parts = [frag for frag, _ in sorted(freq.items(), key=lambda kv: (kv[1], kv[0]))]
+    zdict = ('{"date":"20' + '","rates":[' + "".join(parts)).encode("utf-8")[-size:]
+    dict_id = hashlib.sha256(zdict).hexdigest()[:16]
+    ensure_dir(ZDICT_DIR)
+    place_bytes_atomic(os.path.join(ZDICT_DIR, dict_id + ".bin"), zdict)
+    place_bytes_atomic(os.path.join(ZDICT_DIR, "current"), dict_id.encode("ascii"))
+    print(f"✅ Słownik zlib {dict_id}: {len(zdict)} B z {len(freq)} fragmentów")
+    return dict_id
+
+
+def current_zdict():
+    """
+    (id, bajty) bieżącego słownika; buduje go, jeśli jeszcze nie istnieje.
+    """
+    try:
+        with open(os.path.join(ZDICT_DIR, "current"), "r", encoding="ascii") as f:
+            dict_id = f.read().strip()
+    except FileNotFoundError:
+        dict_id = build_zdict()
+        if dict_id is None:
+            raise RuntimeError("nie można zbudować słownika zlib (pusty magazyn)")
+    return dict_id, load_zdict(dict_id)
+
+
+def daily_encoder():
+    """
+    Funkcja kodująca payload dnia w formacie STORE_FORMAT (picklowalna — dla puli procesów).
+    """
+    if STORE_FORMAT == "zd":
+        dict_id, zdict = current_zdict()
+        return functools.partial(encode_json_zd, zdict=zdict, dict_id=dict_id)
+    return encode_json_gz
+
+
+def place_bytes_atomic(path, blob: bytes, fsync: bool = False):
+    """
+    Zapisuje gotowe bajty atomowo (tmp w tym samym katalogu -> os.replace). Katalog musi istnieć.
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(blob)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+        raise
+
+
+def fsync_dir(dirn):
+    fd = os.open(dirn, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 def write_json_gz_atomic(path, data):
@@ -79,29 +526,54 @@ def write_json_gz_atomic(path, data):
     Zapisuje JSON skompresowany gzip atomowo (tmp -> os.replace).
     Zwraca True jeśli OK.
     """
-    dirn = os.path.dirname(path)
-    os.makedirs(dirn, exist_ok=True)
+    ensure_dir(os.path.dirname(path))
     # przygotuj zawartość
     try:
-        payload_bytes = json.dumps(
-            data,
-            ensure_ascii=False,
-            separators=(",", ":")
-        ).encode("utf-8")
+        blob = encode_json_gz(data)
     except Exception as e:
         print("❌ Błąd serializacji JSON:", e)
         return False
 
-    fd, tmp_path = tempfile.mkstemp(suffix=".json.gz", dir=dirn)
-    os.close(fd)
     try:
-        with gzip.open(tmp_path, "wb") as gz:
-            gz.write(payload_bytes)
-        os.replace(tmp_path, path)
+        place_bytes_atomic(path, blob)
         print("✅ Zapisano:", path)
         return True
     except Exception as e:
         print("❌ Błąd zapisu (gzip):", e)
+        return False
+
+
+def write_daily_atomic(path, data):
+    """
+    Zapis pliku dziennego w formacie wynikającym z rozszerzenia ścieżki (.json.gz / .json.zd).
+    """
+    if not path.endswith(".zd"):
+        return write_json_gz_atomic(path, data)
+    ensure_dir(os.path.dirname(path))
+    try:
+        dict_id, zdict = current_zdict()
+        place_bytes_atomic(path, encode_json_zd(data, zdict, dict_id))
+        print("✅ Zapisano:", path)
+        return True
+    except Exception as e:
+        print("❌ Błąd zapisu (zd):", e)
+        return False
+
+
+def write_json_atomic(path, data):
+    """
+    Zapisuje zwykły (nieskompresowany) JSON atomowo (tmp -> os.replace).
+    """
+    dirn = os.path.dirname(path)
+    os.makedirs(dirn, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=dirn)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print("❌ Błąd zapisu JSON:", path, e)
         try:
             os.remove(tmp_path)
         except Exception:
@@ -122,9 +594,12 @@ def file_sha256(path):
 
 def read_json_from_file(path) -> Optional[dict]:
     """
-    Odczytuje JSON z pliku .json lub .json.gz i zwraca obiekt (lub None).
+    Odczytuje JSON z pliku .json, .json.gz lub .json.zd i zwraca obiekt (lub None).
     """
     try:
+        if path.endswith(".zd"):
+            with open(path, "rb") as f:
+                return decode_json_zd(f.read())
         if path.endswith(".gz"):
             with gzip.open(path, "rt", encoding="utf-8") as f:
                 return json.load(f)
@@ -139,7 +614,7 @@ def read_json_from_file(path) -> Optional[dict]:
 # Legacy migration
 # -------------------
 
-FNAME_REGEX = re.compile(r"^(\d{2})_(\d{2})_(\d{4})(?:\.json|\.json\.gz)$")
+FNAME_REGEX = re.compile(r"^(\d{2})_(\d{2})_(\d{4})(?:\.json|\.json\.gz|\.json\.zd)$")
 
 def migrate_legacy_structure():
     """
@@ -166,6 +641,8 @@ def migrate_legacy_structure():
         if re.fullmatch(r"\d{4}", name):
             # już katalog roku -> OK
             continue
+        if name in DERIVED_DIRS:
+            continue
         # jeżeli katalog wygląda jak .something lub ma pliki które warto zostawić, nadal spróbujemy przenieść wszystko co pasuje
         print(f"📂 Przetwarzam legacy katalog: {sub}")
         try:
@@ -180,7 +657,7 @@ def migrate_legacy_structure():
                 continue
 
             # tylko pliki .json lub .json.gz
-            if not (fname.endswith(".json") or fname.endswith(".json.gz")):
+            if not (fname.endswith(".json") or fname.endswith(".json.gz") or fname.endswith(".json.zd")):
                 print("ℹ Pomijam nierelewantny plik:", src_path)
                 continue
 
@@ -322,176 +799,1948 @@ def migrate_legacy_structure():
 
 
 # -------------------
-# HTTP + processing
+# Normalizacja formatu (.json -> .json.gz)
 # -------------------
 
-# http_get z retry/backoff. Zwraca treść (string) lub obiekt urllib.error.HTTPError lub inny Exception
-def http_get(url, retries=3, backoff_base=0.5, timeout=60):
-    attempt = 0
-    while True:
-        attempt += 1
-        req = urllib.request.Request(url, headers=HEADERS)
-        try:
-            with urllib.request.urlopen(req, timeout=timeout) as resp:
-                raw = resp.read()
-                charset = resp.headers.get_content_charset() or "utf-8"
-                return raw.decode(charset)
-        except urllib.error.HTTPError as e:
-            # 404 chcemy zwrócić natychmiast (ktoś sprawdza resp.code == 404)
-            if e.code == 404:
-                return e
-            # dla błędów serwera możemy spróbować retry
-            if 500 <= e.code < 600 and attempt <= retries:
-                wait = backoff_base * (2 ** (attempt - 1))
-                print(f"⚠ HTTPError {e.code}, próba {attempt}/{retries}. Czekam {wait}s i retry...")
-                time.sleep(wait)
+def _canonical(data):
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def normalize_store(dedupe_only: bool = False):
+    """
+    Doprowadza magazyn do jednego kanonicznego pliku na dzień (STORE_EXT, domyślnie .json.gz):
+      - gdy dzień ma kilka plików z tą samą treścią -> zostaje kanoniczny (lub tworzony z dowolnego),
+      - gdy treść się różni -> wygrywa najnowszy plik (zapisany w formacie kanonicznym),
+      - pojedynczy plik w innym formacie -> konwersja (chyba że dedupe_only).
+    Zwraca słownik z licznikami.
+    """
+    stats = {"removed_duplicates": 0, "converted": 0, "conflicts": 0, "errors": 0}
+    for name in sorted(os.listdir(BASE_OUT_DIR)):
+        if not re.fullmatch(r"\d{4}", name):
+            continue
+        year_dir = os.path.join(BASE_OUT_DIR, name)
+        by_stem = {}
+        conversions = []
+        for fname in os.listdir(year_dir):
+            if FNAME_REGEX.match(fname):
+                stem = fname.split(".", 1)[0]
+                by_stem.setdefault(stem, []).append(os.path.join(year_dir, fname))
+        for stem, paths in sorted(by_stem.items()):
+            target = os.path.join(year_dir, stem + STORE_EXT)
+            if paths == [target] or (dedupe_only and len(paths) == 1):
                 continue
-            return e
-        except Exception as e:
-            # transient network error - retry limited times
-            if attempt <= retries:
-                wait = backoff_base * (2 ** (attempt - 1))
-                print(f"⚠ Błąd sieci ({e}), próba {attempt}/{retries}. Czekam {wait}s i retry...")
-                time.sleep(wait)
+            contents = {p: read_json_from_file(p) for p in paths}
+            if any(v is None for v in contents.values()):
+                stats["errors"] += 1
                 continue
-            print("❌ HTTP:", e)
-            return e
+            if len({_canonical(v) for v in contents.values()}) > 1:
+                stats["conflicts"] += 1
+                source = max(paths, key=os.path.getmtime)
+                print("⚠ Różna treść plików dnia, zostaje najnowszy:", source)
+            else:
+                source = target if target in contents else paths[0]
+            if source == target or (dedupe_only and len(paths) > 1):
+                # kanoniczny plik już jest (albo tylko deduplikacja) — usuwamy pozostałe
+                for p in paths:
+                    if p != source:
+                        os.remove(p)
+                        stats["removed_duplicates"] += 1
+                        print("🗑 Usunięto duplikat:", p)
+            else:
+                conversions.append(([p for p in paths if p != target], target, contents[source]))
+        # konwersje roku jedną paczką: kompresja w puli procesów (COMPRESS_WORKERS), zapis tutaj
+        if conversions:
+            blobs = encode_many([c[2] for c in conversions])
+            for (others, target, _), blob in zip(conversions, blobs):
+                try:
+                    place_bytes_atomic(target, blob)
+                    for p in others:
+                        os.remove(p)
+                    stats["converted"] += 1
+                    stats["removed_duplicates"] += len(others) - 1
+                except Exception as e:
+                    print("❌ Błąd konwersji", target, ":", e)
+                    stats["errors"] += 1
+    print(
+        f"🧹 Normalizacja: duplikaty {stats['removed_duplicates']}, konwersje {stats['converted']}, "
+        f"konflikty {stats['conflicts']}, błędy {stats['errors']}"
+    )
+    return stats
 
 
-# defensywna funkcja przetwarzajaca pojedyńczy wpis
-def process_table_entry(entry):
-    # defensywne pobranie pól
-    eff_date = None
-    if isinstance(entry, dict):
-        eff_date = entry.get("effectiveDate") or entry.get("effective_date") or entry.get("date")
-        rates = entry.get("rates", []) if isinstance(entry, dict) else []
-    else:
-        print("⚠ Nieoczekiwany entry (nie dict) — pomijam:", entry)
-        return False
+# -------------------
+# Metadane walut (currencies.json) i odchudzony format dzienny
+# -------------------
 
-    if not eff_date:
-        print("⚠ Brak pola effectiveDate/date w entry, pomijam:", entry)
-        return False
+_currencies = None
+_currencies_dirty = False
 
-    try:
-        d = datetime.strptime(eff_date[:10], "%Y-%m-%d").date()
-    except Exception as e:
-        print("❌ Nieprawidłowy format daty:", eff_date, e)
-        return False
 
-    out_path = path_for_date(d)
+def load_currencies():
+    """
+    {"version": n, "currencies": {kod: [{"name", "from", "to"}, ...]}} — przedziały posortowane po "from",
+    daty ISO włącznie (pierwszy i ostatni dzień tabeli z daną nazwą).
+    """
+    global _currencies
+    if _currencies is None:
+        try:
+            with open(CURRENCIES_FILE, "r", encoding="utf-8") as f:
+                _currencies = json.load(f)
+        except FileNotFoundError:
+            _currencies = {"version": 0, "currencies": {}}
+        except Exception as e:
+            print("⚠ Nie udało się odczytać", CURRENCIES_FILE, "— buduję od nowa:", e)
+            _currencies = {"version": 0, "currencies": {}}
+    return _currencies
 
-    if os.path.exists(out_path):
-        append_last_marker(out_path)
-        return True
 
-    rates_list = []
-    for r in rates:
-        if not isinstance(r, dict):
-            print("⚠ Nieoczekiwany element w rates (nie dict) — pomijam:", r)
-            continue
+def note_currency(code, name, d: date):
+    """
+    Rejestruje, że w dniu d waluta code nazywała się name: wydłuża sąsiedni przedział z tą samą nazwą
+    albo otwiera nowy (zmiana nazwy przez NBP).
+    """
+    global _currencies_dirty
+    if not code or not name:
+        return
+    key = d.isoformat()
+    spans = load_currencies()["currencies"].setdefault(code, [])
+    before = after = None
+    for i, span in enumerate(spans):
+        if span["from"] <= key <= span["to"]:
+            if span["name"] == name:
+                return
+            # inna nazwa w środku przedziału (korekta) — dzielimy przedział na trzy
+            parts = [{"name": name, "from": key, "to": key}]
+            if span["from"] < key:
+                parts.insert(0, dict(span, to=(d - timedelta(days=1)).isoformat()))
+            if key < span["to"]:
+                parts.append(dict(span, **{"from": (d + timedelta(days=1)).isoformat()}))
+            spans[i:i + 1] = parts
+            _currencies_dirty = True
+            return
+        if span["to"] < key:
+            before = span
+        elif after is None:
+            after = span
+    if before is not None and before["name"] == name:
+        before["to"] = key
+        if after is not None and after["name"] == name:
+            before["to"] = after["to"]
+            spans.remove(after)
+    elif after is not None and after["name"] == name:
+        after["from"] = key
+    else:
+        spans.append({"name": name, "from": key, "to": key})
+        spans.sort(key=lambda s: s["from"])
+    _currencies_dirty = True
 
-        code = r.get("code")
-        currency = r.get("currency") or r.get("name") or None
 
-        rate_entry = {}
-        if currency is not None:
-            rate_entry["currency"] = currency
-        if code is not None:
-            rate_entry["code"] = code
-        if "mid" in r:
-            rate_entry["mid"] = r["mid"]
-        if "bid" in r:
-            rate_entry["bid"] = r["bid"]
-        if "ask" in r:
-            rate_entry["ask"] = r["ask"]
+def currency_name(code, d: date) -> Optional[str]:
+    """
+    Nazwa waluty obowiązująca w dniu d (poza przedziałami: ostatnia wcześniejsza albo pierwsza znana).
+    """
+    spans = load_currencies()["currencies"].get(code)
+    if not spans:
+        return None
+    key = d.isoformat() if isinstance(d, date) else str(d)[:10]
+    name = spans[0]["name"]
+    for span in spans:
+        if span["from"] > key:
+            break
+        name = span["name"]
+    return name
+
+
+def save_currencies():
+    global _currencies_dirty
+    if not _currencies_dirty:
+        return
+    _currencies["version"] = _currencies.get("version", 0) + 1
+    _currencies["currencies"] = dict(sorted(_currencies["currencies"].items()))
+    if write_json_atomic(CURRENCIES_FILE, _currencies):
+        _currencies_dirty = False
 
-        if not rate_entry:
-            print("⚠ Pusty/nieużyteczny rate_entry — pomijam:", r)
+
+def build_currencies():
+    """
+    Uzupełnia tabelę walut o nazwy ze wszystkich plików dziennych w formacie "full".
+    """
+    for name in sorted(os.listdir(BASE_OUT_DIR)):
+        if not re.fullmatch(r"\d{4}", name):
             continue
+        for d, path in sorted(daily_files_for_year(int(name)).items()):
+            data = read_json_from_file(path)
+            if not isinstance(data, dict):
+                continue
+            for r in data.get("rates", []):
+                if isinstance(r, dict):
+                    note_currency(r.get("code"), r.get("currency"), d)
+    print("✅ Tabela walut:", len(load_currencies()["currencies"]), "kodów")
 
-        rates_list.append(rate_entry)
 
-    payload = {
-        "date": eff_date,
-        "rates": rates_list,
-    }
+def slim_payload(payload):
+    """
+    {"date", "rates": [...]} -> {"date", "mid": {kod: kurs}} (+ "bid"/"ask", jeśli są w tabeli).
+    """
+    out = {"date": payload.get("date")}
+    for field in ("mid", "bid", "ask"):
+        values = {r["code"]: r[field] for r in payload.get("rates", []) if r.get("code") and field in r}
+        if values:
+            out[field] = values
+    return out
 
-    if write_json_gz_atomic(out_path, payload):
-        append_last_marker(out_path)
-        return True
-    return False
 
+def stored_payload(payload):
+    return slim_payload(payload) if PAYLOAD_FORMAT == "slim" else payload
 
-def fetch_range(start_d: date, end_d: date):
-    url = BASE_TABLE_URL.format(
-        start=start_d.isoformat(),
-        end=end_d.isoformat()
-    )
-    resp = http_get(url)
-    if isinstance(resp, Exception):
-        return None
-    try:
-        return json.loads(resp)
-    except Exception:
-        return None
 
+def expand_payload(data, names: bool = True):
+    """
+    Zwraca dzień w formacie "full" niezależnie od formatu pliku; nazwy walut dla "slim"
+    pochodzą z tabeli walut (names=False pomija je).
+    """
+    if "rates" in data or not any(f in data for f in ("mid", "bid", "ask")):
+        return data
+    d = str(data.get("date", ""))[:10]
+    codes = sorted(set().union(*(data.get(f, {}) for f in ("mid", "bid", "ask"))))
+    rates = []
+    for code in codes:
+        r = {}
+        name = currency_name(code, d) if names else None
+        if name:
+            r["currency"] = name
+        r["code"] = code
+        for field in ("mid", "bid", "ask"):
+            if code in data.get(field, {}):
+                r[field] = data[field][code]
+        rates.append(r)
+    return {"date": data.get("date"), "rates": rates}
 
-def backfill():
-    print("🔁 BACKFILL od", START_DATE.isoformat())
-    cur = START_DATE
-    today = date.today()
-    bad_dir = os.path.join(BASE_OUT_DIR, "bad_entries")
-    os.makedirs(bad_dir, exist_ok=True)
 
-    while cur <= today:
-        chunk_end = min(cur + timedelta(days=CHUNK_DAYS - 1), today)
-        print(f"📥 Pobieram zakres: {cur.isoformat()} — {chunk_end.isoformat()}")
-        data = fetch_range(cur, chunk_end)
-        if data:
-            for entry in data:
-                try:
-                    process_table_entry(entry)
-                except Exception as e:
-                    # nie przerywamy backfilla — zapisujemy problematyczny wpis do folderu bad_entries
-                    print("❌ Błąd przetwarzania wpisu (zapisuję do bad_entries):", e)
-                    bad_path = os.path.join(
-                        bad_dir,
-                        "bad_" + datetime.utcnow().isoformat().replace(":", "_") + ".json"
-                    )
-                    try:
-                        with open(bad_path, "w", encoding="utf-8") as bf:
-                            json.dump(entry, bf, ensure_ascii=False, indent=2)
-                        print("ℹ Zapisano problematyczny wpis:", bad_path)
-                    except Exception as e2:
-                        print("❌ Nie udało się zapisać problematycznego wpisu:", e2)
+# -------------------
+# Manifest skrótów treści
+# -------------------
+
+# tabela -> {data ISO: digest}; zapisywane tylko tabele zmienione w przebiegu
+_digests = {}
+_digests_dirty = set()
+
+
+def payload_digest(payload) -> str:
+    """
+    sha256 (hex, jak file_sha256) kanonicznej postaci kursów dnia: data + kursy posortowane po kodzie,
+    tylko pola liczbowe. Nazwy walut są pomijane — starsze pliki ich nie mają, a korekty NBP dotyczą kursów.
+    Format "full" i "slim" tego samego dnia dają ten sam skrót.
+    """
+    rates = sorted(
+        (
+            {k: r[k] for k in ("code", "mid", "bid", "ask") if k in r}
+            for r in expand_payload(payload, names=False)["rates"] if isinstance(r, dict)
+        ),
+        key=lambda r: str(r.get("code")),
+    )
+    canonical = {"date": str(payload.get("date", ""))[:10], "rates": rates}
+    return hashlib.sha256(_canonical(canonical).encode("utf-8")).hexdigest()
+
+
+def load_digests(table: str = "A"):
+    if table not in _digests:
+        path = table_file(table, DIGEST_MANIFEST)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                _digests[table] = json.load(f)
+        except FileNotFoundError:
+            _digests[table] = {}
+        except Exception as e:
+            print("⚠ Nie udało się odczytać", path, "— buduję od nowa:", e)
+            _digests[table] = {}
+    return _digests[table]
+
+
+def stored_digest(d: date, path: str, table: str = "A") -> Optional[str]:
+    """
+    Skrót treści istniejącego pliku dnia; przy braku wpisu w manifeście czyta plik raz i go zapamiętuje.
+    """
+    digests = load_digests(table)
+    key = d.isoformat()
+    if key not in digests:
+        data = read_json_from_file(path)
+        if not isinstance(data, dict):
+            return None
+        digests[key] = payload_digest(data)
+        _digests_dirty.add(table)
+    return digests[key]
+
+
+def set_digest(d: date, digest: str, table: str = "A"):
+    load_digests(table)[d.isoformat()] = digest
+    _digests_dirty.add(table)
+
+
+def save_digests():
+    for table in sorted(_digests_dirty):
+        path = table_file(table, DIGEST_MANIFEST)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                # jedna para na linię — mały diff w git przy dopisaniu dnia
+                json.dump(_digests[table], f, sort_keys=True, indent=0)
+            os.replace(tmp_path, path)
+            _digests_dirty.discard(table)
+        except Exception as e:
+            print("❌ Błąd zapisu", path, ":", e)
+
+
+# -------------------
+# Archiwum roczne
+# -------------------
+
+# dni zapisane w bieżącym przebiegu; archiwa lat są aktualizowane raz, w flush_derived()
+_pending_days = {}
+
+
+def register_written_day(d: date, payload):
+    _pending_days[d] = payload
+
+
+def archive_path_for_year(year: int):
+    return os.path.join(ARCHIVE_DIR, f"{year}.json.gz")
+
+
+def _daily_ext(path):
+    return path[path.index(".json"):]
+
+
+def daily_files_for_year(year: int):
+    """
+    Zwraca {date: ścieżka} plików dziennych w katalogu roku (przy kilku formatach wygrywa kanoniczny).
+    """
+    rank = {ext: i for i, ext in enumerate(daily_ext_priority())}
+    year_dir = os.path.join(BASE_OUT_DIR, str(year))
+    out = {}
+    try:
+        names = sorted(os.listdir(year_dir))
+    except FileNotFoundError:
+        return out
+    for fname in names:
+        m = FNAME_REGEX.match(fname)
+        if not m:
+            continue
+        try:
+            d = date(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+        except ValueError:
+            continue
+        path = os.path.join(year_dir, fname)
+        if d in out and rank[_daily_ext(out[d])] <= rank[_daily_ext(path)]:
+            continue
+        out[d] = path
+    return out
+
+
+def read_year_archive(year: int) -> Optional[dict]:
+    path = archive_path_for_year(year)
+    if not os.path.exists(path):
+        return None
+    return read_json_from_file(path)
+
+
+def _merge_into_archive(archive, payloads):
+    """
+    Wstawia/aktualizuje wiersze archiwum dla {date: payload}. Nowe kody walut dostają nową kolumnę.
+    """
+    codes = list(archive["codes"])
+    names = dict(archive["names"])
+    rows = {d: dict(zip(codes, row)) for d, row in zip(archive["dates"], archive["mid"])}
+    for d, payload in payloads.items():
+        row = {}
+        for r in payload.get("rates", []):
+            code = r.get("code")
+            if not code or "mid" not in r:
+                continue
+            row[code] = r["mid"]
+            if r.get("currency"):
+                names[code] = r["currency"]
+        rows[d.isoformat()] = row
+    codes = sorted(set(codes).union(*(row.keys() for row in rows.values())))
+    dates = sorted(rows)
+    return {
+        "year": archive["year"],
+        "codes": codes,
+        "names": {c: names[c] for c in codes if c in names},
+        "dates": dates,
+        "mid": [[rows[d].get(c) for c in codes] for d in dates],
+    }
+
+
+def build_year_archive(year: int):
+    """
+    Buduje od zera archiwum roku z plików dziennych.
+    """
+    payloads = {}
+    for d, path in daily_files_for_year(year).items():
+        data = read_json_from_file(path)
+        if isinstance(data, dict):
+            payloads[d] = expand_payload(data)
+    if not payloads:
+        return False
+    empty = {"year": year, "codes": [], "names": {}, "dates": [], "mid": []}
+    return write_json_gz_atomic(archive_path_for_year(year), _merge_into_archive(empty, payloads))
+
+
+def update_year_archive(year: int, payloads):
+    """
+    Dopisuje dni do istniejącego archiwum roku (lub buduje je, jeśli go brak).
+    """
+    archive = read_year_archive(year)
+    if archive is None:
+        return build_year_archive(year)
+    return write_json_gz_atomic(archive_path_for_year(year), _merge_into_archive(archive, payloads))
+
+
+def flush_derived():
+    """
+    Aktualizuje dane pochodne dla dni zapisanych w tym przebiegu.
+    """
+    save_digests()
+    if not os.path.exists(CURRENCIES_FILE):
+        build_currencies()
+    save_currencies()
+    if not _pending_days:
+        if not os.path.exists(WEB_MANIFEST):
+            write_web_manifest()
+        elif LEDGER.written_paths:
+            # zapisano tylko tabele B/C albo złoto — lata tabeli A bez zmian, odświeżamy sekcję datasets
+            write_web_manifest(set())
+        return
+    by_year = {}
+    for d, payload in _pending_days.items():
+        by_year.setdefault(d.year, {})[d] = payload
+    for year in sorted(by_year):
+        update_year_archive(year, by_year[year])
+    # szeregi przed manifestem, żeby katalog api/series w manifeście był aktualny
+    if os.path.isdir(SERIES_DIR):
+        update_series(by_year)
+    else:
+        rebuild_series()
+    changed = {os.path.basename(path_for_date(d)) for d in _pending_days}
+    write_web_manifest(set(by_year) if os.path.exists(WEB_MANIFEST) else None, changed)
+    if os.path.exists(RATES_BIN_PATH):
+        try:
+            append_rate_matrix(_pending_days)
+        except Exception as e:
+            print("❌ Błąd aktualizacji macierzy kursów:", e)
+    _pending_days.clear()
+
+
+# -------------------
+# Manifest dla strony (docs/exc/manifest.json)
+# -------------------
+
+def _manifest_entry(path):
+    """
+    [nazwa, rozmiar, pierwsze 16 znaków sha256 pliku]
+    """
+    digest = file_sha256(path)
+    return [os.path.basename(path), os.path.getsize(path), digest[:16] if digest else None]
+
+
+def _manifest_year(year: int, previous=None, changed=()):
+    """
+    Lista plików dziennych roku; wpisy z poprzedniego manifestu są używane ponownie,
+    chyba że plik jest w changed albo zmienił mu się rozmiar.
+    """
+    prev = {e[0]: e for e in (previous or [])}
+    year_dir = os.path.join(BASE_OUT_DIR, str(year))
+    files = []
+    for fname in sorted(os.listdir(year_dir), key=lambda n: (n[6:10], n[3:5], n[0:2])):
+        if not FNAME_REGEX.match(fname):
+            continue
+        path = os.path.join(year_dir, fname)
+        old = prev.get(fname)
+        if old is not None and fname not in changed and old[1] == os.path.getsize(path):
+            files.append(old)
+        else:
+            files.append(_manifest_entry(path))
+    return files
+
+
+def _manifest_datasets(previous=None):
+    """
+    Pliki pozostałych zbiorów (tabele B i C, szeregi api, złoto) jako {katalog: [[nazwa, rozmiar, digest]]}.
+    Wpis z poprzedniego manifestu jest używany ponownie, gdy plik nie był zapisany w tym przebiegu
+    i ma ten sam rozmiar; szeregi api (ich zapisy nie trafiają do dziennika przebiegu) są przeliczane zawsze.
+    """
+    previous = previous or {}
+    written = set(LEDGER.written_paths)
+    api_dir = API_DIR.replace(os.sep, "/")
+    dirs = {}
+    for root in (TABLE_DIRS["B"], TABLE_DIRS["C"], API_DIR):
+        for dirpath, dirnames, filenames in os.walk(root):
+            # pliki stanu (.digests.json, .no_table, ...) i bad_entries nie są danymi
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d != "bad_entries")
+            key = dirpath.replace(os.sep, "/")
+            names = sorted(f for f in filenames if not f.startswith(".") and not f.endswith(".tmp"))
+            if names:
+                dirs[key] = names
+    if os.path.exists(GOLD_PATH):
+        dirs.setdefault((os.path.dirname(GOLD_PATH) or ".").replace(os.sep, "/"), []).append(
+            os.path.basename(GOLD_PATH))
+
+    datasets = {}
+    for key in sorted(dirs):
+        prev = {e[0]: e for e in previous.get(key, [])}
+        files = []
+        for fname in dirs[key]:
+            path = os.path.join(key, fname)
+            old = prev.get(fname)
+            if old is not None and not key.startswith(api_dir) and f"{key}/{fname}" not in written \
+                    and old[1] == os.path.getsize(path):
+                files.append(old)
+            else:
+                files.append(_manifest_entry(path))
+        datasets[key] = files
+    return datasets
+
+
+def write_web_manifest(years_changed=None, changed_files=()):
+    """
+    Aktualizuje docs/exc/manifest.json. years_changed=None przebudowuje wszystkie lata,
+    w przeciwnym razie tylko wskazane (pozostałe lata są przepisywane z poprzedniej wersji).
+    Sekcja datasets opisuje pliki pozostałych zbiorów (katalog -> pliki).
+    """
+    previous = None
+    if years_changed is not None and os.path.exists(WEB_MANIFEST):
+        previous = read_json_from_file(WEB_MANIFEST)
+    prev_years = (previous or {}).get("years", {})
+    datasets = _manifest_datasets((previous or {}).get("datasets"))
+
+    years = {}
+    for name in sorted(os.listdir(BASE_OUT_DIR)):
+        if not re.fullmatch(r"\d{4}", name):
+            continue
+        if previous is not None and int(name) not in years_changed and name in prev_years:
+            years[name] = prev_years[name]
+            continue
+        files = _manifest_year(int(name), prev_years.get(name, {}).get("files"), changed_files)
+        archive = archive_path_for_year(int(name))
+        years[name] = {
+            "count": len(files),
+            "files": files,
+            "archive": _manifest_entry(archive) if os.path.exists(archive) else None,
+        }
+
+    last_date = None
+    for name in sorted(years, reverse=True):
+        if years[name]["files"]:
+            m = FNAME_REGEX.match(years[name]["files"][-1][0])
+            last_date = f"{m.group(3)}-{m.group(2)}-{m.group(1)}"
+            break
+    manifest = {
+        "version": 1,
+        "updated": datetime.now(ZoneInfo(TZ)).isoformat(timespec="seconds"),
+        "base": BASE_OUT_DIR.replace(os.sep, "/"),
+        "last_date": last_date,
+        "files": sum(y["count"] for y in years.values()),
+        "years": years,
+    }
+    tmp_path = WEB_MANIFEST + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # jeden rok na linię: kompaktowo, a diff w git obejmuje tylko zmienione lata
+            f.write("{" + ",".join(
+                json.dumps(k) + ":" + json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+                for k, v in manifest.items() if k != "years"
+            ) + ',"years":{\n')
+            f.write(",\n".join(
+                json.dumps(k) + ":" + json.dumps(v, separators=(",", ":")) for k, v in years.items()
+            ))
+            # jeden katalog na linię, jak lata
+            f.write('\n},"datasets":{\n')
+            f.write(",\n".join(
+                json.dumps(k) + ":" + json.dumps(v, separators=(",", ":")) for k, v in datasets.items()
+            ))
+            f.write("\n}}\n")
+        os.replace(tmp_path, WEB_MANIFEST)
+        print("✅ Zapisano:", WEB_MANIFEST)
+        return True
+    except Exception as e:
+        print("❌ Błąd zapisu", WEB_MANIFEST, ":", e)
+        return False
+
+
+# -------------------
+# Statyczne API: szeregi per waluta (docs/api/series)
+# -------------------
+
+def _archive_columns(archive):
+    """
+    {code: ([daty], [mid])} z archiwum roku, bez dni, w których waluta nie była notowana.
+    """
+    out = {}
+    for j, code in enumerate(archive["codes"]):
+        dates, mids = [], []
+        for dstr, row in zip(archive["dates"], archive["mid"]):
+            if row[j] is not None:
+                dates.append(dstr)
+                mids.append(row[j])
+        if dates:
+            out[code] = (dates, mids)
+    return out
+
+
+def update_series(years):
+    """
+    Aktualizuje docs/api/series/<CODE>.json (pełna historia) i <CODE>/<YEAR>.json
+    dla wskazanych lat, na podstawie aktualnych archiwów rocznych.
+    Pełny szereg jest sklejany: dni ze zmienionych lat są zastępowane, reszta zostaje.
+    """
+    years = sorted(set(years))
+    per_code = {}
+    names = {}
+    for year in years:
+        archive = read_year_archive(year)
+        if archive is None:
+            continue
+        names.update(archive.get("names", {}))
+        for code, (dates, mids) in _archive_columns(archive).items():
+            write_json_atomic(
+                os.path.join(SERIES_DIR, code, f"{year}.json"),
+                {"code": code, "year": year, "dates": dates, "mid": mids},
+            )
+            per_code.setdefault(code, {})[year] = (dates, mids)
+
+    touched = {str(y) for y in years}
+    for code, by_year in per_code.items():
+        path = os.path.join(SERIES_DIR, f"{code}.json")
+        points = {}
+        if os.path.exists(path):
+            old = read_json_from_file(path) or {}
+            for dstr, mid in zip(old.get("dates", []), old.get("mid", [])):
+                if dstr[:4] not in touched:
+                    points[dstr] = mid
+        for dates, mids in by_year.values():
+            points.update(zip(dates, mids))
+        dates = sorted(points)
+        write_json_atomic(path, {
+            "code": code,
+            "currency": names.get(code),
+            "dates": dates,
+            "mid": [points[d] for d in dates],
+        })
+    if per_code:
+        write_series_index()
+        print(f"✅ Zaktualizowano szeregi {len(per_code)} walut w {SERIES_DIR}")
+
+
+def write_series_index():
+    """
+    docs/api/series/index.json: kod -> nazwa, pierwszy i ostatni dzień, lata z plikami rocznymi.
+    """
+    index = {}
+    for fname in sorted(os.listdir(SERIES_DIR)):
+        if not fname.endswith(".json") or fname == "index.json":
+            continue
+        data = read_json_from_file(os.path.join(SERIES_DIR, fname)) or {}
+        if not data.get("dates"):
+            continue
+        code = data["code"]
+        year_dir = os.path.join(SERIES_DIR, code)
+        index[code] = {
+            "currency": data.get("currency"),
+            "first": data["dates"][0],
+            "last": data["dates"][-1],
+            "points": len(data["dates"]),
+            "years": sorted(int(f[:4]) for f in os.listdir(year_dir) if f.endswith(".json")),
+        }
+    write_json_atomic(os.path.join(SERIES_DIR, "index.json"), index)
+
+
+def rebuild_series():
+    """
+    Buduje statyczne API od zera (brakujące archiwa roczne są tworzone).
+    """
+    years = []
+    for name in sorted(os.listdir(BASE_OUT_DIR)):
+        if re.fullmatch(r"\d{4}", name):
+            if read_year_archive(int(name)) is None:
+                build_year_archive(int(name))
+            years.append(int(name))
+    if os.path.isdir(SERIES_DIR):
+        shutil.rmtree(SERIES_DIR)
+    update_series(years)
+
+
+def rebuild_archives():
+    for name in sorted(os.listdir(BASE_OUT_DIR)):
+        if re.fullmatch(r"\d{4}", name):
+            build_year_archive(int(name))
+
+
+# -------------------
+# Binarna macierz kursów
+# -------------------
+#
+# Układ pliku (little-endian):
+#   8 B   magic b"NBPRATE1"
+#   4 B   uint32 — ordinal (date.toordinal) pierwszego dnia
+#   2 B   uint16 — liczba walut N
+#   2 B   zarezerwowane
+#   N*3 B kody walut ASCII, dopełnione zerami do wielokrotności 8 B
+#   dalej wiersz float64[N] dla każdego kolejnego dnia kalendarzowego (NaN = brak kursu)
+# Kurs (date, code) leży więc pod stałym przesunięciem i nie wymaga parsowania.
+
+RATES_BIN_MAGIC = b"NBPRATE1"
+_BIN_HEADER = struct.Struct("<8sIHH")
+
+
+def _bin_data_offset(n_codes: int) -> int:
+    return _BIN_HEADER.size + (n_codes * 3 + 7) // 8 * 8
+
+
+def _read_bin_header(f):
+    magic, start_ord, n_codes, _ = _BIN_HEADER.unpack(f.read(_BIN_HEADER.size))
+    if magic != RATES_BIN_MAGIC:
+        raise ValueError("nieprawidłowy plik macierzy kursów")
+    raw = f.read(n_codes * 3)
+    codes = [raw[i:i + 3].decode("ascii") for i in range(0, len(raw), 3)]
+    return start_ord, codes
+
+
+def _bin_row(codes, payload):
+    mids = {r.get("code"): r.get("mid") for r in payload.get("rates", [])}
+    values = [mids.get(c) for c in codes]
+    return struct.pack(f"<{len(codes)}d", *(math.nan if v is None else float(v) for v in values))
+
+
+def build_rate_matrix(path: str = RATES_BIN_PATH):
+    """
+    Buduje od zera binarną macierz kursów z rocznych archiwów (brakujące archiwa są tworzone).
+    """
+    archives = []
+    for name in sorted(os.listdir(BASE_OUT_DIR)):
+        if not re.fullmatch(r"\d{4}", name):
+            continue
+        archive = read_year_archive(int(name))
+        if archive is None and build_year_archive(int(name)):
+            archive = read_year_archive(int(name))
+        if archive and archive["dates"]:
+            archives.append(archive)
+    if not archives:
+        print("⚠ Brak danych do zbudowania macierzy kursów")
+        return False
+
+    codes = sorted(set().union(*(a["codes"] for a in archives)))
+    start_ord = date.fromisoformat(archives[0]["dates"][0]).toordinal()
+    end_ord = date.fromisoformat(archives[-1]["dates"][-1]).toordinal()
+    col = {c: i for i, c in enumerate(codes)}
+    values = [math.nan] * ((end_ord - start_ord + 1) * len(codes))
+    for a in archives:
+        idx = [col[c] for c in a["codes"]]
+        for dstr, row in zip(a["dates"], a["mid"]):
+            base = (date.fromisoformat(dstr).toordinal() - start_ord) * len(codes)
+            for j, v in zip(idx, row):
+                if v is not None:
+                    values[base + j] = float(v)
+
+    header = _BIN_HEADER.pack(RATES_BIN_MAGIC, start_ord, len(codes), 0)
+    header += "".join(codes).encode("ascii").ljust(_bin_data_offset(len(codes)) - _BIN_HEADER.size, b"\0")
+    dirn = os.path.dirname(path) or "."
+    os.makedirs(dirn, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".bin", dir=dirn)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(struct.pack(f"<{len(values)}d", *values))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print("❌ Błąd zapisu macierzy kursów:", e)
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+        return False
+    print(f"✅ Zapisano macierz kursów: {path} ({end_ord - start_ord + 1} dni × {len(codes)} walut)")
+    return True
+
+
+def append_rate_matrix(payloads, path: str = RATES_BIN_PATH):
+    """
+    Dopisuje/nadpisuje w miejscu wiersze dla {date: payload}. Jeśli pojawi się nowa waluta
+    albo dzień sprzed początku macierzy, przebudowuje plik w całości.
+    """
+    with open(path, "r+b") as f:
+        start_ord, codes = _read_bin_header(f)
+        known = set(codes)
+        if any(d.toordinal() < start_ord for d in payloads) or any(
+            r.get("code") not in known
+            for p in payloads.values() for r in p.get("rates", []) if "mid" in r
+        ):
+            f.close()
+            return build_rate_matrix(path)
+        offset = _bin_data_offset(len(codes))
+        row_size = 8 * len(codes)
+        f.seek(0, os.SEEK_END)
+        n_days = (f.tell() - offset) // row_size
+        empty_row = struct.pack(f"<{len(codes)}d", *([math.nan] * len(codes)))
+        for d in sorted(payloads):
+            idx = d.toordinal() - start_ord
+            if idx > n_days:
+                f.seek(offset + n_days * row_size)
+                f.write(empty_row * (idx - n_days))
+                n_days = idx
+            f.seek(offset + idx * row_size)
+            f.write(_bin_row(codes, payloads[d]))
+            n_days = max(n_days, idx + 1)
+    return True
+
+
+class RateMatrix:
+    """
+    Odczyt binarnej macierzy kursów przez mmap: rate(date, code) to jedno przesunięcie w pliku.
+    """
+
+    def __init__(self, path: str = RATES_BIN_PATH):
+        self.path = path
+        self._file = open(path, "rb")
+        start_ord, self.codes = _read_bin_header(self._file)
+        self.start = date.fromordinal(start_ord)
+        self._col = {c: i for i, c in enumerate(self.codes)}
+        self._offset = _bin_data_offset(len(self.codes))
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.n_days = (len(self._mm) - self._offset) // (8 * len(self.codes))
+        self.end = self.start + timedelta(days=self.n_days - 1)
+
+    def rate(self, d: date, code: str) -> Optional[float]:
+        idx = d.toordinal() - self.start.toordinal()
+        col = self._col.get(code)
+        if col is None or not 0 <= idx < self.n_days:
+            return None
+        v = struct.unpack_from("<d", self._mm, self._offset + (idx * len(self.codes) + col) * 8)[0]
+        return None if math.isnan(v) else v
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -------------------
+# HTTP + processing
+# -------------------
+
+class TokenBucket:
+    """
+    Limit zapytań wspólny dla wszystkich wątków: rate żetonów na sekundę, najwyżej burst na zapas.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+RATE_LIMITER = TokenBucket(HTTP_RATE_LIMIT, HTTP_MAX_PER_HOST)
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def _host_slot(url):
+    """
+    Zwraca semafor ograniczający liczbę równoległych żądań do hosta z url.
+    """
+    host = urlsplit(url).netloc
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = threading.BoundedSemaphore(HTTP_MAX_PER_HOST)
+            _host_slots[host] = slot
+        return slot
+
+
+# błędy oznaczające, że serwer zamknął połączenie keep-alive — wtedy łączymy się od nowa
+_RECONNECT_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+
+class HttpPool:
+    """
+    Pula połączeń keep-alive (http.client.HTTP(S)Connection) per host.
+    Bezczynne połączenia starsze niż idle_timeout są zamykane, a zerwane
+    połączenie z puli jest jednokrotnie odtwarzane przed zgłoszeniem błędu.
+    """
+
+    def __init__(self, idle_timeout: float = HTTP_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, key, timeout):
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used <= self.idle_timeout:
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        scheme, netloc = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=timeout), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            self._idle.setdefault(key, []).append((conn, time.monotonic()))
+
+    def request(self, url, headers, timeout):
+        """
+        Wykonuje GET i zwraca (status, reason, headers, body) z body już rozpakowanym z gzip.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        with _host_slot(url):
+            while True:
+                conn, reused = self._acquire(key, timeout)
+                try:
+                    conn.request("GET", target, headers=headers)
+                    resp = conn.getresponse()
+                    body = resp.read()
+                except _RECONNECT_ERRORS:
+                    conn.close()
+                    if reused:
+                        # serwer zamknął bezczynne połączenie — spróbuj na świeżym
+                        continue
+                    raise
+                except Exception:
+                    conn.close()
+                    raise
+                if resp.will_close:
+                    conn.close()
+                else:
+                    self._release(key, conn)
+                break
+        if (resp.getheader("Content-Encoding") or "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return resp.status, resp.reason, resp.msg, body
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle.clear()
+
+
+HTTP_POOL = HttpPool()
+
+
+# http_get z retry/backoff. Zwraca treść (string) lub obiekt urllib.error.HTTPError lub inny Exception
+def http_get(url, retries=3, backoff_base=0.5, timeout=60):
+    attempt = 0
+    while True:
+        attempt += 1
+        RATE_LIMITER.acquire()
+        try:
+            status, reason, headers, raw = HTTP_POOL.request(url, HEADERS, timeout)
+            if not 200 <= status < 300:
+                raise urllib.error.HTTPError(url, status, reason, headers, io.BytesIO(raw))
+            charset = headers.get_content_charset() or "utf-8"
+            return raw.decode(charset)
+        except urllib.error.HTTPError as e:
+            # 404 chcemy zwrócić natychmiast (ktoś sprawdza resp.code == 404)
+            if e.code == 404:
+                return e
+            # dla błędów serwera możemy spróbować retry
+            if 500 <= e.code < 600 and attempt <= retries:
+                wait = backoff_base * (2 ** (attempt - 1))
+                print(f"⚠ HTTPError {e.code}, próba {attempt}/{retries}. Czekam {wait}s i retry...")
+                time.sleep(wait)
+                continue
+            return e
+        except Exception as e:
+            # transient network error - retry limited times
+            if attempt <= retries:
+                wait = backoff_base * (2 ** (attempt - 1))
+                print(f"⚠ Błąd sieci ({e}), próba {attempt}/{retries}. Czekam {wait}s i retry...")
+                time.sleep(wait)
+                continue
+            print("❌ HTTP:", e)
+            return e
+
+
+class WriteStage:
+    """
+    Jeden etap zapisu dla wszystkich zbiorów danych: wątki pobierające przekazują zadania (submit),
+    a wykonuje je tylko wątek główny w run_until() — digesty, dziennik przebiegu, _pending_days
+    i tabela walut nie potrzebują blokad. Poza orkiestratorem submit wykonuje zadanie od razu.
+    """
+
+    def __init__(self, maxsize: int = WRITE_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self._queue = None
+
+    def submit(self, dataset: str, fn, *args):
+        if self._queue is None or threading.current_thread() is threading.main_thread():
+            return self._execute(dataset, fn, args)
+        # pełna kolejka wstrzymuje pobieranie, zanim dane zajmą zbyt dużo pamięci
+        self._queue.put((dataset, fn, args))
+        return None
+
+    def _execute(self, dataset, fn, args):
+        t0 = time.monotonic()
+        LEDGER.dataset = dataset
+        try:
+            return fn(*args)
+        except Exception as e:
+            print(f"❌ Błąd zapisu ({dataset}):", e)
+            LEDGER.record("failed")
+            return None
+        finally:
+            LEDGER.dataset = None
+            LEDGER.add_time(dataset, "write_s", time.monotonic() - t0)
+
+    def run_until(self, futures):
+        """
+        Wykonuje zadania z kolejki, dopóki nie zakończą się wszystkie futures i kolejka nie opustoszeje.
+        """
+        self._queue = queue.Queue(self.maxsize)
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    if all(f.done() for f in futures) and self._queue.empty():
+                        return
+                    continue
+                self._execute(*item)
+        finally:
+            self._queue = None
+
+
+WRITER = WriteStage()
+
+
+class BatchWriter:
+    """
+    Etap zapisu dla backfilla/sync: zbiera dni, a flush() zapisuje je paczką pogrupowaną
+    po katalogu roku — katalog jest tworzony raz, fsync katalogu (WRITE_FSYNC) raz na paczkę.
+    """
+
+    def __init__(self, fsync: bool = WRITE_FSYNC):
+        self.fsync = fsync
+        self._items = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, d: date, out_path, payload, digest, existing, table: str = "A"):
+        self._items[(table, d)] = (out_path, payload, digest, existing)
+
+    def flush(self):
+        """
+        Zapisuje zebrane dni; zwraca liczbę udanych zapisów.
+        """
+        by_dir = {}
+        for key, item in sorted(self._items.items()):
+            by_dir.setdefault(os.path.dirname(item[0]), []).append((key, item))
+        self._items = {}
+        ok_count = 0
+        for dirn, items in by_dir.items():
+            ensure_dir(dirn)
+            # serializacja + gzip (opcjonalnie w puli procesów), zapis bajtów w procesie głównym
+            try:
+                blobs = encode_many([stored_payload(item[1]) for _, item in items])
+            except Exception as e:
+                print("❌ Błąd serializacji JSON:", e)
+                blobs = [None] * len(items)
+            for ((table, d), (out_path, payload, digest, existing)), blob in zip(items, blobs):
+                ok = False
+                if blob is not None:
+                    try:
+                        place_bytes_atomic(out_path, blob, self.fsync)
+                        ok = True
+                    except Exception as e:
+                        print("❌ Błąd zapisu (gzip):", out_path, e)
+                ok_count += finish_day_write(d, out_path, payload, digest, existing, ok, table)
+            if self.fsync:
+                fsync_dir(dirn)
+        if ok_count:
+            print(f"✅ Zapisano {ok_count} plików w {len(by_dir)} katalogach")
+        return ok_count
+
+
+def finish_day_write(d: date, out_path, payload, digest, existing, ok: bool, table: str = "A") -> bool:
+    """
+    Księgowanie po zapisie dnia: usunięcie zastąpionego pliku, digest, dziennik, dane pochodne
+    (archiwa, szeregi, macierz — tylko dla tabeli A).
+    """
+    if not ok:
+        LEDGER.record("failed", out_path)
+        return False
+    if existing and existing != out_path:
+        try:
+            os.remove(existing)
+        except Exception as e:
+            print("⚠ Nie udało się usunąć starego pliku", existing, ":", e)
+    set_digest(d, digest, table)
+    LEDGER.record("corrected" if existing else "written", out_path)
+    if table == "A":
+        register_written_day(d, payload)
+    return True
+
+
+# defensywna funkcja przetwarzajaca pojedyńczy wpis
+def process_table_entry(entry, writer: Optional[BatchWriter] = None, table: str = "A"):
+    """
+    Normalizuje wpis tabeli i zapisuje dzień, jeśli jest nowy albo NBP go skorygował.
+    Z writer zapis jest tylko kolejkowany — wykona go writer.flush().
+    """
+    # defensywne pobranie pól
+    eff_date = None
+    if isinstance(entry, dict):
+        eff_date = entry.get("effectiveDate") or entry.get("effective_date") or entry.get("date")
+        rates = entry.get("rates", []) if isinstance(entry, dict) else []
+    else:
+        print("⚠ Nieoczekiwany entry (nie dict) — pomijam:", entry)
+        return False
+
+    if not eff_date:
+        print("⚠ Brak pola effectiveDate/date w entry, pomijam:", entry)
+        return False
+
+    try:
+        d = datetime.strptime(eff_date[:10], "%Y-%m-%d").date()
+    except Exception as e:
+        print("❌ Nieprawidłowy format daty:", eff_date, e)
+        return False
+
+    rates_list = []
+    for r in rates:
+        if not isinstance(r, dict):
+            print("⚠ Nieoczekiwany element w rates (nie dict) — pomijam:", r)
+            continue
+
+        code = r.get("code")
+        currency = r.get("currency") or r.get("name") or None
+
+        rate_entry = {}
+        if currency is not None:
+            rate_entry["currency"] = currency
+        if code is not None:
+            rate_entry["code"] = code
+        if "mid" in r:
+            rate_entry["mid"] = r["mid"]
+        if "bid" in r:
+            rate_entry["bid"] = r["bid"]
+        if "ask" in r:
+            rate_entry["ask"] = r["ask"]
+
+        if not rate_entry:
+            print("⚠ Pusty/nieużyteczny rate_entry — pomijam:", r)
+            continue
+
+        if table == "A":
+            note_currency(code, currency, d)
+        rates_list.append(rate_entry)
+
+    payload = {
+        "date": eff_date,
+        "rates": rates_list,
+    }
+
+    out_path = path_for_date(d, table)
+    digest = payload_digest(payload)
+
+    # dzień może już leżeć jako .json (starsze lata) — nie twórz drugiej kopii .json.gz
+    existing = find_existing_path(d, table)
+    if existing:
+        if stored_digest(d, existing, table) == digest:
+            LEDGER.record("skipped")
+            return True
+        print("🔄 NBP skorygował tabelę — nadpisuję:", existing)
+
+    if writer is not None:
+        writer.add(d, out_path, payload, digest, existing, table)
+        return True
+    ok = write_daily_atomic(out_path, stored_payload(payload))
+    return finish_day_write(d, out_path, payload, digest, existing, ok, table)
+
+
+def fetch_range(start_d: date, end_d: date, table: str = "A", url_template: Optional[str] = None):
+    url = (url_template or BASE_TABLE_URL).format(
+        table=table,
+        start=start_d.isoformat(),
+        end=end_d.isoformat()
+    )
+    resp = http_get(url)
+    # 404 -> NBP nie ma żadnej tabeli w zakresie (pusty wynik, nie błąd)
+    if isinstance(resp, urllib.error.HTTPError) and resp.code == 404:
+        return []
+    if isinstance(resp, Exception):
+        return None
+    try:
+        return json.loads(resp)
+    except Exception:
+        return None
+
+
+def iter_chunks(start_d: date, end_d: date, chunk_days: int = CHUNK_DAYS):
+    """
+    Dzieli zakres [start_d, end_d] na kolejne okna po maks. chunk_days dni.
+    """
+    cur = start_d
+    while cur <= end_d:
+        chunk_end = min(cur + timedelta(days=chunk_days - 1), end_d)
+        yield cur, chunk_end
+        cur = chunk_end + timedelta(days=1)
+
+
+def save_bad_entry(entry, bad_dir):
+    """
+    Zapisuje problematyczny wpis do folderu bad_entries (nie przerywa przebiegu).
+    """
+    bad_path = os.path.join(
+        bad_dir,
+        "bad_" + datetime.utcnow().isoformat().replace(":", "_") + ".json"
+    )
+    try:
+        os.makedirs(bad_dir, exist_ok=True)
+        with open(bad_path, "w", encoding="utf-8") as bf:
+            json.dump(entry, bf, ensure_ascii=False, indent=2)
+        print("ℹ Zapisano problematyczny wpis:", bad_path)
+    except Exception as e2:
+        print("❌ Nie udało się zapisać problematycznego wpisu:", e2)
+
+
+def write_entries(entries, bad_dir, table: str = "A"):
+    """
+    Etap zapisu: normalizuje pobrane wpisy tabel i zapisuje je jedną paczką (BatchWriter).
+    Zwraca liczbę błędów (wpisy z wyjątkiem przy przetwarzaniu + dni, których zapis się nie udał).
+    """
+    failed = 0
+    writer = BatchWriter()
+    for entry in entries:
+        try:
+            process_table_entry(entry, writer, table)
+        except Exception as e:
+            # nie przerywamy backfilla — zapisujemy problematyczny wpis do folderu bad_entries
+            print("❌ Błąd przetwarzania wpisu (zapisuję do bad_entries):", e)
+            LEDGER.record("failed")
+            save_bad_entry(entry, bad_dir)
+            failed += 1
+    queued = len(writer)
+    return failed + queued - writer.flush()
+
+
+def fetch_chunks_ordered(chunks, workers: int = BACKFILL_WORKERS, table: str = "A",
+                         url_template: Optional[str] = None):
+    """
+    Pobiera zakresy tabeli (albo innego zasobu z url_template) równolegle w puli wątków
+    i zwraca wyniki w kolejności chunks jako (start, end, data). W locie jest najwyżej
+    2 * workers zakresów, więc pamięć nie rośnie z długością backfilla.
+    """
+    chunks = list(chunks)
+    if workers <= 1:
+        for start_d, end_d in chunks:
+            yield start_d, end_d, fetch_range(start_d, end_d, table, url_template)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nbp-fetch") as pool:
+        pending = deque()
+        it = iter(chunks)
+        for start_d, end_d in it:
+            pending.append((start_d, end_d, pool.submit(fetch_range, start_d, end_d, table, url_template)))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            start_d, end_d, fut = pending.popleft()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append((nxt[0], nxt[1], pool.submit(fetch_range, nxt[0], nxt[1], table, url_template)))
+            yield start_d, end_d, fut.result()
+
+
+def load_backfill_journal(table: str = "A"):
+    """
+    Wczytuje dziennik backfilla i zwraca posortowane, scalone zakresy [(start, end)]
+    dni już pobranych. Uszkodzone linie (np. urwane przy crashu) są pomijane.
+    """
+    ranges = []
+    try:
+        with open(table_file(table, BACKFILL_JOURNAL), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    ranges.append((date.fromisoformat(rec["start"]), date.fromisoformat(rec["end"])))
+                except Exception:
+                    continue
+    except FileNotFoundError:
+        return []
+    ranges.sort()
+    merged = []
+    for start_d, end_d in ranges:
+        if merged and start_d <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_d))
         else:
+            merged.append((start_d, end_d))
+    return merged
+
+
+def range_covered(start_d: date, end_d: date, merged_ranges):
+    return any(s <= start_d and end_d <= e for s, e in merged_ranges)
+
+
+def append_backfill_journal(start_d: date, end_d: date, entries: int, table: str = "A"):
+    rec = {
+        "start": start_d.isoformat(),
+        "end": end_d.isoformat(),
+        "entries": entries,
+        "ts": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+    try:
+        with open(table_file(table, BACKFILL_JOURNAL), "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+    except Exception as e:
+        print("❌ Błąd zapisu dziennika backfilla:", e)
+
+
+def backfill(workers: Optional[int] = None, table: str = "A"):
+    """
+    Pobiera tabelę od START_DATE; znacznik BACKFILL_MARKER tylko gdy wszystkie zakresy się udały
+    (pobranie sprawdza backfill, zapis — zadanie znacznika). Zwraca liczbę niepobranych zakresów.
+    """
+    workers = BACKFILL_WORKERS if workers is None else max(1, workers)
+    print(f"🔁 BACKFILL tabeli {table} od", START_DATE.isoformat(), f"(wątki: {workers})")
+    today = date.today()
+    bad_dir = os.path.join(table_dir(table), "bad_entries")
+    os.makedirs(bad_dir, exist_ok=True)
+
+    t0 = time.monotonic()
+    journal = table_file(table, BACKFILL_JOURNAL)
+    done = load_backfill_journal(table)
+    all_chunks = list(iter_chunks(START_DATE, today))
+    chunks = [c for c in all_chunks if not range_covered(c[0], c[1], done)]
+    if len(chunks) < len(all_chunks):
+        print(f"⏭ Pomijam {len(all_chunks) - len(chunks)} zakresów z dziennika {journal}")
+    failed = 0
+    # zakresy zapisane w całości — zadania zapisu wykonują się w kolejności zgłoszenia, więc
+    # zadanie znacznika widzi wynik wszystkich zakresów
+    state = {"written": 0}
+    # pobieranie w puli wątków, zapis w wątku głównym w kolejności zakresów
+    for cur, chunk_end, data in fetch_chunks_ordered(chunks, workers, table):
+        print(f"📥 Zakres: {cur.isoformat()} — {chunk_end.isoformat()}")
+        if data is None:
+            # błąd pobierania — zakres nie trafia do dziennika, zostanie ponowiony
             print(f"⚠ Brak danych dla zakresu {cur.isoformat()} — {chunk_end.isoformat()}")
+            failed += 1
+            continue
+        WRITER.submit(table, write_backfill_chunk, data, bad_dir, table, cur, chunk_end, today, state)
+
+    if failed:
+        # bez znacznika następne uruchomienie ponowi backfill (gotowe zakresy pominie dziennik)
+        print(f"⚠ BACKFILL NIEPEŁNY: {failed}/{len(chunks)} zakresów bez danych — nie zapisuję {table_file(table, BACKFILL_MARKER)}")
+        return failed
+    print(f"📦 BACKFILL tabeli {table}: pobrano {len(chunks)} zakresów ({time.monotonic() - t0:.1f}s)")
+    WRITER.submit(table, write_backfill_marker, table, state, len(chunks))
+    return 0
+
+
+def write_backfill_chunk(data, bad_dir, table: str, start_d: date, end_d: date, today: date,
+                         state: Optional[dict] = None):
+    errors = write_entries(data, bad_dir, table)
+    if errors:
+        # zakres nie trafia do dziennika — następny backfill pobierze go ponownie
+        print(f"⚠ Zakres {start_d.isoformat()} — {end_d.isoformat()}: {errors} błędów zapisu, pomijam w dzienniku")
+        return
+    if state is not None:
+        state["written"] += 1
+    # zakres obejmujący dzisiaj może jeszcze dostać tabelę — nie oznaczamy go jako gotowy
+    if end_d < today:
+        append_backfill_journal(start_d, end_d, len(data), table)
 
-        cur = chunk_end + timedelta(days=1)
 
+def write_backfill_marker(table: str = "A", state: Optional[dict] = None, expected: int = 0):
+    if state is not None and state["written"] < expected:
+        print(f"⚠ BACKFILL NIEPEŁNY: {expected - state['written']}/{expected} zakresów z błędami zapisu"
+              f" — nie zapisuję {table_file(table, BACKFILL_MARKER)}")
+        return
     try:
-        with open(BACKFILL_MARKER, "w", encoding="utf-8") as f:
+        with open(table_file(table, BACKFILL_MARKER), "w", encoding="utf-8") as f:
             f.write(datetime.utcnow().isoformat())
+        print(f"✅ BACKFILL tabeli {table} ZAKOŃCZONY")
     except Exception as e:
         print("❌ Nie udało się zapisać BACKFILL_MARKER:", e)
-    print("✅ BACKFILL ZAKOŃCZONY")
 
 
-def fetch_recent_and_today(today: date, lookback_days: int = 7):
+# -------------------
+# Kalendarz publikacji NBP
+# -------------------
+
+# Jednorazowe dni bez tabeli poza świętami ustawowymi (np. żałoba narodowa 2005-04-08)
+NBP_EXTRA_CLOSURES = frozenset({
+    date(2005, 4, 8),
+})
+
+
+def easter_sunday(year: int) -> date:
+    """
+    Data Wielkanocy w kalendarzu gregoriańskim (algorytm Meeusa/Jonesa/Butchera).
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+@functools.lru_cache(maxsize=None)
+def polish_holidays(year: int) -> frozenset:
+    """
+    Dni ustawowo wolne od pracy w Polsce w danym roku (łącznie ze świętami ruchomymi).
+    """
+    easter = easter_sunday(year)
+    days = {
+        date(year, 1, 1),              # Nowy Rok
+        date(year, 5, 1),              # Święto Pracy
+        date(year, 5, 3),              # Święto Konstytucji 3 Maja
+        date(year, 8, 15),             # Wniebowzięcie NMP
+        date(year, 11, 1),             # Wszystkich Świętych
+        date(year, 11, 11),            # Święto Niepodległości
+        date(year, 12, 25),            # Boże Narodzenie
+        date(year, 12, 26),            # drugi dzień Bożego Narodzenia
+        easter,                        # Wielkanoc
+        easter + timedelta(days=1),    # Poniedziałek Wielkanocny
+        easter + timedelta(days=49),   # Zielone Świątki
+        easter + timedelta(days=60),   # Boże Ciało
+    }
+    if year >= 2011:
+        days.add(date(year, 1, 6))     # Trzech Króli
+    if year >= 2025:
+        days.add(date(year, 12, 24))   # Wigilia
+    return frozenset(days)
+
+
+def is_publication_day(d: date) -> bool:
+    """
+    Czy NBP publikuje tabelę A w danym dniu (dzień roboczy, nie święto).
+    """
+    return d.weekday() < 5 and d not in polish_holidays(d.year) and d not in NBP_EXTRA_CLOSURES
+
+
+# -------------------
+# Indeks dat + synchronizacja luk
+# -------------------
+
+def scan_store(table: str = "A"):
+    """
+    Skanuje katalogi lat drzewa tabeli i zwraca zbiór dat, dla których istnieje plik dzienny.
+    """
+    present = set()
+    base = table_dir(table)
+    try:
+        years = os.listdir(base)
+    except FileNotFoundError:
+        return present
+    for name in years:
+        if not re.fullmatch(r"\d{4}", name):
+            continue
+        try:
+            files = os.listdir(os.path.join(base, name))
+        except Exception:
+            continue
+        for fname in files:
+            m = FNAME_REGEX.match(fname)
+            if not m:
+                continue
+            try:
+                present.add(date(int(m.group(3)), int(m.group(2)), int(m.group(1))))
+            except ValueError:
+                continue
+    return present
+
+
+def load_no_table_dates(table: str = "A", path: Optional[str] = None):
+    path = path or table_file(table, NO_TABLE_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {date.fromisoformat(x) for x in json.load(f)}
+    except FileNotFoundError:
+        return set()
+    except Exception as e:
+        print("⚠ Nie udało się odczytać", path, ":", e)
+        return set()
+
+
+def save_no_table_dates(dates, table: str = "A", path: Optional[str] = None):
+    path = path or table_file(table, NO_TABLE_FILE)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(sorted(d.isoformat() for d in dates), f, separators=(",", ":"))
+    except Exception as e:
+        print("❌ Błąd zapisu", path, ":", e)
+
+
+def expected_publication_dates(start_d: date, end_d: date):
+    """
+    Dni, w których NBP powinien opublikować tabelę A (dni robocze bez świąt).
+    """
+    out = []
+    d = start_d
+    while d <= end_d:
+        if is_publication_day(d):
+            out.append(d)
+        d += timedelta(days=1)
+    return out
+
+
+def coalesce_ranges(dates, max_days: int = CHUNK_DAYS):
+    """
+    Grupuje posortowane daty w minimalną liczbę zakresów [(start, end)]
+    o długości najwyżej max_days (limit API NBP to 93 dni na zapytanie).
+    """
+    ranges = []
+    for d in sorted(dates):
+        if ranges and (d - ranges[-1][0]).days < max_days:
+            ranges[-1] = (ranges[-1][0], d)
+        else:
+            ranges.append((d, d))
+    return ranges
+
+
+def sync(start_d: Optional[date] = None, end_d: Optional[date] = None, workers: Optional[int] = None,
+         table: str = "A"):
+    """
+    Uzupełnia brakujące dni tabeli: porównuje zawartość magazynu z kalendarzem publikacji
+    i pobiera tylko zakresy obejmujące luki.
+    """
+    today = datetime.now(ZoneInfo(TZ)).date()
+    start_d = start_d or START_DATE
+    end_d = min(end_d or today, today)
+    workers = BACKFILL_WORKERS if workers is None else max(1, workers)
+
+    present = scan_store(table)
+    no_table = load_no_table_dates(table)
+    missing = [
+        d for d in expected_publication_dates(start_d, end_d)
+        if d not in present and d not in no_table
+    ]
+    if not missing:
+        print(f"✔ Brak luk w zakresie {start_d.isoformat()} — {end_d.isoformat()}")
+        return 0
+
+    ranges = coalesce_ranges(missing)
+    print(f"🩹 Tabela {table}: brakuje {len(missing)} dni — pobieram {len(ranges)} zakresów")
+    bad_dir = os.path.join(table_dir(table), "bad_entries")
+    missing_set = set(missing)
+    newly_empty = set()
+    for cur, range_end, data in fetch_chunks_ordered(ranges, workers, table):
+        print(f"📥 Zakres: {cur.isoformat()} — {range_end.isoformat()}")
+        if data is None:
+            print(f"⚠ Brak danych dla zakresu {cur.isoformat()} — {range_end.isoformat()}")
+            continue
+        WRITER.submit(table, write_entries, data, bad_dir, table)
+        returned = set()
+        for entry in data:
+            if isinstance(entry, dict) and entry.get("effectiveDate"):
+                try:
+                    returned.add(date.fromisoformat(entry["effectiveDate"][:10]))
+                except ValueError:
+                    pass
+        # dzień roboczy bez tabeli w odpowiedzi NBP -> święto/dzień wolny; dzisiejsza tabela może jeszcze dojść
+        for d in missing_set:
+            if cur <= d <= range_end and d < today and d not in returned:
+                newly_empty.add(d)
+
+    if newly_empty:
+        print(f"ℹ {len(newly_empty)} dni bez tabeli NBP — zapisuję w {table_file(table, NO_TABLE_FILE)}")
+        ensure_dir(table_dir(table))
+        WRITER.submit(table, save_no_table_dates, no_table | newly_empty, table)
+    return len(ranges)
+
+
+# -------------------
+# Tabela B (publikacja tygodniowa, plik na rok)
+# -------------------
+
+def table_b_path(year: int):
+    return os.path.join(table_dir("B"), f"{year}.json.gz")
+
+
+def read_table_b_year(year: int) -> dict:
+    """
+    Plik roku tabeli B: {"year", "names": {kod: nazwa}, "tables": {data ISO: {kod: mid}}} —
+    tylko faktyczne dni publikacji i tylko notowane w nich waluty.
+    """
+    path = table_b_path(year)
+    data = read_json_from_file(path) if os.path.exists(path) else None
+    if not isinstance(data, dict):
+        return {"year": year, "names": {}, "tables": {}}
+    return data
+
+
+def scan_table_b():
+    """
+    Zbiór dat tabel B zapisanych w plikach lat.
+    """
+    present = set()
+    try:
+        names = os.listdir(table_dir("B"))
+    except FileNotFoundError:
+        return present
+    for name in names:
+        m = re.fullmatch(r"(\d{4})\.json\.gz", name)
+        if m:
+            present.update(date.fromisoformat(k) for k in read_table_b_year(int(m.group(1)))["tables"])
+    return present
+
+
+def merge_table_b(entries):
+    """
+    Dopisuje (lub koryguje) tabele B w plikach lat — każdy rok jest czytany i zapisywany raz.
+    Zwraca liczbę zmienionych dni.
+    """
+    by_year = {}
+    for entry in entries:
+        eff_date = entry.get("effectiveDate") if isinstance(entry, dict) else None
+        try:
+            d = datetime.strptime(str(eff_date)[:10], "%Y-%m-%d").date()
+        except ValueError:
+            print("⚠ Wpis tabeli B bez poprawnej daty — pomijam:", eff_date)
+            LEDGER.record("failed")
+            continue
+        by_year.setdefault(d.year, []).append((d, entry))
+    changed = 0
+    for year, items in sorted(by_year.items()):
+        data = read_table_b_year(year)
+        statuses = []
+        for d, entry in items:
+            mids = {}
+            for r in entry.get("rates", []):
+                if isinstance(r, dict) and r.get("code") and "mid" in r:
+                    mids[r["code"]] = r["mid"]
+                    if r.get("currency"):
+                        data["names"][r["code"]] = r["currency"]
+            key = d.isoformat()
+            if data["tables"].get(key) == mids:
+                LEDGER.record("skipped")
+                continue
+            statuses.append("corrected" if key in data["tables"] else "written")
+            data["tables"][key] = mids
+        if not statuses:
+            continue
+        data["tables"] = dict(sorted(data["tables"].items()))
+        data["names"] = dict(sorted(data["names"].items()))
+        path = table_b_path(year)
+        ok = write_json_gz_atomic(path, data)
+        for status in statuses:
+            LEDGER.record(status if ok else "failed", path)
+        changed += len(statuses) if ok else 0
+    return changed
+
+
+def table_b_missing_weeks(start_d: date, end_d: date, today: date):
+    """
+    Środy tygodni z zakresu, w których magazyn nie ma żadnej tabeli B. NBP publikuje ją w środę,
+    a gdy środa jest wolna — w innym dniu tygodnia, więc luką jest tydzień, nie konkretny dzień.
+    """
+    present_weeks = {tuple(d.isocalendar())[:2] for d in scan_table_b()}
+    no_table = load_no_table_dates("B")
+    missing = []
+    wed = start_d + timedelta(days=(2 - start_d.weekday()) % 7)
+    while wed <= min(end_d, today):
+        if tuple(wed.isocalendar())[:2] not in present_weeks and wed not in no_table:
+            missing.append(wed)
+        wed += timedelta(days=7)
+    return missing
+
+
+def sync_table_b(start_d: Optional[date] = None, end_d: Optional[date] = None, workers: Optional[int] = None):
+    """
+    Uzupełnia brakujące tygodnie tabeli B tym samym pobieraniem zakresów co backfill
+    (pon–pt każdego brakującego tygodnia, sąsiednie tygodnie scalone w zakresy do CHUNK_DAYS dni).
+    Zwraca liczbę nieudanych zakresów.
+    """
+    today = datetime.now(ZoneInfo(TZ)).date()
+    start_d = start_d or START_DATE
+    end_d = min(end_d or today, today)
+    workers = BACKFILL_WORKERS if workers is None else max(1, workers)
+
+    missing = table_b_missing_weeks(start_d, end_d, today)
+    if not missing:
+        print(f"✔ Tabela B: brak luk w zakresie {start_d.isoformat()} — {end_d.isoformat()}")
+        return 0
+    # zakres środ krótszy o 4 dni, bo każdy rozszerzamy o poniedziałek–wtorek i czwartek–piątek
+    ranges = [
+        (first - timedelta(days=2), min(last + timedelta(days=2), today))
+        for first, last in coalesce_ranges(missing, CHUNK_DAYS - 4)
+    ]
+    print(f"🩹 Tabela B: brakuje {len(missing)} tygodni — pobieram {len(ranges)} zakresów")
+    no_table = load_no_table_dates("B")
+    newly_empty = set()
+    failed = 0
+    for cur, range_end, data in fetch_chunks_ordered(ranges, workers, "B"):
+        print(f"📥 Zakres: {cur.isoformat()} — {range_end.isoformat()}")
+        if data is None:
+            print(f"⚠ Brak danych dla zakresu {cur.isoformat()} — {range_end.isoformat()}")
+            failed += 1
+            continue
+        WRITER.submit("B", merge_table_b, data)
+        returned_weeks = set()
+        for entry in data:
+            if isinstance(entry, dict) and entry.get("effectiveDate"):
+                try:
+                    returned_weeks.add(tuple(date.fromisoformat(entry["effectiveDate"][:10]).isocalendar())[:2])
+                except ValueError:
+                    pass
+        # tydzień bez tabeli w odpowiedzi — tylko gdy pobraliśmy go w całości (do piątku, przed dzisiaj)
+        for wed in missing:
+            if cur <= wed and wed + timedelta(days=2) <= range_end < today \
+                    and tuple(wed.isocalendar())[:2] not in returned_weeks:
+                newly_empty.add(wed)
+
+    if newly_empty:
+        print(f"ℹ {len(newly_empty)} tygodni bez tabeli B — zapisuję w {table_file('B', NO_TABLE_FILE)}")
+        ensure_dir(table_dir("B"))
+        WRITER.submit("B", save_no_table_dates, no_table | newly_empty, "B")
+    return failed
+
+
+def check_table_b(start_d: Optional[date] = None, end_d: Optional[date] = None):
+    """
+    Offline: tygodnie bez tabeli B w magazynie (zwraca listę śród).
+    """
+    today = datetime.now(ZoneInfo(TZ)).date()
+    start_d = start_d or START_DATE
+    end_d = min(end_d or today, today)
+    missing = table_b_missing_weeks(start_d, end_d, today)
+    print(f"🔍 Tabela B {start_d.isoformat()} — {end_d.isoformat()}: brakujące tygodnie {len(missing)}")
+    for wed in missing:
+        print("  brak tygodnia:", wed.isoformat())
+    return missing
+
+
+# -------------------
+# Ceny złota (cenyzlota, jeden plik CSV)
+# -------------------
+
+def read_gold_series(path: str = GOLD_PATH) -> dict:
+    """
+    Cała historia cen złota jednym odczytem: {date: cena}.
+    """
+    series = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            next(f, None)  # nagłówek
+            for line in f:
+                day, _, price = line.strip().partition(",")
+                try:
+                    series[date.fromisoformat(day)] = float(price)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return series
+
+
+def write_gold_series(series: dict, path: str = GOLD_PATH) -> bool:
+    """
+    Zapisuje szereg jako CSV posortowany po dacie (nowe dni to kolejne linie na końcu) — atomowo.
+    """
+    lines = ["data,cena"] + [f"{d.isoformat()},{series[d]!r}" for d in sorted(series)]
+    try:
+        ensure_dir(os.path.dirname(path) or ".")
+        place_bytes_atomic(path, ("\n".join(lines) + "\n").encode("utf-8"))
+        print("✅ Zapisano:", path)
+        return True
+    except Exception as e:
+        print("❌ Błąd zapisu", path, ":", e)
+        return False
+
+
+def sync_gold(start_d: Optional[date] = None, end_d: Optional[date] = None, workers: Optional[int] = None):
+    """
+    Uzupełnia brakujące ceny złota jak sync(): porównuje szereg z kalendarzem publikacji
+    i pobiera tylko zakresy (do GOLD_CHUNK_DAYS dni) obejmujące luki — także te w środku historii.
+    Scalanie i zapis pliku idą przez etap zapisu (WRITER). Zwraca liczbę nieudanych zakresów.
+    """
+    today = datetime.now(ZoneInfo(TZ)).date()
+    start_d = max(start_d or START_DATE, GOLD_START)
+    end_d = min(end_d or today, today)
+    workers = BACKFILL_WORKERS if workers is None else max(1, workers)
+
+    series = read_gold_series()
+    no_price = load_no_table_dates(path=GOLD_NO_PRICE_FILE)
+    missing = [
+        d for d in expected_publication_dates(start_d, end_d)
+        if d not in series and d not in no_price
+    ]
+    if not missing:
+        print("✔ Ceny złota aktualne")
+        return 0
+
+    ranges = coalesce_ranges(missing, GOLD_CHUNK_DAYS)
+    print(f"🪙 Ceny złota: brakuje {len(missing)} dni — pobieram {len(ranges)} zakresów")
+    statuses = []
+    failed = 0
+    newly_empty = set()
+    for cur, range_end, data in fetch_chunks_ordered(ranges, workers, url_template=GOLD_URL):
+        if data is None:
+            # zakres zostaje luką w szeregu — następny przebieg pobierze go ponownie
+            print(f"⚠ Brak danych dla zakresu {cur.isoformat()} — {range_end.isoformat()}")
+            failed += 1
+            continue
+        WRITER.submit("GOLD", merge_gold, series, data, statuses)
+        returned = set()
+        for item in data:
+            try:
+                returned.add(date.fromisoformat(str(item["data"])[:10]))
+            except (KeyError, TypeError, ValueError):
+                pass
+        # dzień publikacji bez ceny w odpowiedzi; dzisiejsza cena może jeszcze dojść
+        for d in missing:
+            if cur <= d <= range_end and d < today and d not in returned:
+                newly_empty.add(d)
+    WRITER.submit("GOLD", finish_gold, series, statuses)
+
+    if newly_empty:
+        print(f"ℹ {len(newly_empty)} dni bez ceny złota — zapisuję w {GOLD_NO_PRICE_FILE}")
+        WRITER.submit("GOLD", save_no_table_dates, no_price | newly_empty, "GOLD", GOLD_NO_PRICE_FILE)
+    return failed
+
+
+def merge_gold(series: dict, data, statuses: list):
+    for item in data:
+        try:
+            d = date.fromisoformat(str(item["data"])[:10])
+            price = float(item["cena"])
+        except (KeyError, TypeError, ValueError):
+            print("⚠ Nieprawidłowy wpis ceny złota — pomijam:", item)
+            LEDGER.record("failed")
+            continue
+        if series.get(d) == price:
+            LEDGER.record("skipped")
+            continue
+        statuses.append("corrected" if d in series else "written")
+        series[d] = price
+
+
+def finish_gold(series: dict, statuses: list):
+    if not statuses:
+        return
+    ok = write_gold_series(series)
+    for status in statuses:
+        LEDGER.record(status if ok else "failed", GOLD_PATH)
+
+
+def fetch_latest(today: date, table: str = "A") -> bool:
+    """
+    Szybka ścieżka dziennego przebiegu — jedno zapytanie:
+      - brak nowych dni publikacji od ostatniej tabeli w magazynie -> last/1 (ewentualna korekta),
+      - brakuje tylko dzisiejszej -> today (404 = jeszcze nie opublikowana),
+      - brakuje więcej -> last/{n}; dzień oczekiwany, a nieobecny w odpowiedzi to luka
+        naprawiana przez sync() tylko w jej zakresie.
+    Zwraca False przy błędzie API (wtedy używamy fetch_recent_and_today).
+    """
+    present = scan_store(table)
+    no_table = load_no_table_dates(table)
+    last_local = max((d for d in present if d <= today), default=None)
+    if last_local is None:
+        return False
+    expected = [d for d in expected_publication_dates(last_local + timedelta(days=1), today) if d not in no_table]
+    if len(expected) > LAST_TABLES_MAX:
+        print(f"ℹ Tabela {table}: brakuje {len(expected)} dni publikacji — uzupełniam zakresami")
+        sync(last_local + timedelta(days=1), today, table=table)
+        return True
+    if expected == [today]:
+        url = TODAY_TABLE_URL.format(table=table)
+    else:
+        url = LAST_TABLES_URL.format(table=table, n=max(1, len(expected)))
+    print(f"🔎 Tabela {table}: ostatnia w magazynie {last_local.isoformat()}, nowych dni publikacji {len(expected)}")
+    resp = http_get(url)
+    if isinstance(resp, urllib.error.HTTPError) and resp.code == 404:
+        print(f"ℹ Tabela {table}: brak nowej tabeli (404)")
+        return True
+    if isinstance(resp, Exception):
+        print("❌ Błąd szybkiej ścieżki:", resp)
+        return False
+    try:
+        data = json.loads(resp)
+    except Exception as e:
+        print("❌ Nie udało się zdekodować JSON:", e)
+        return False
+
+    returned = set()
+    for entry in data:
+        if isinstance(entry, dict) and entry.get("effectiveDate"):
+            try:
+                returned.add(date.fromisoformat(entry["effectiveDate"][:10]))
+            except ValueError:
+                pass
+    if data:
+        print(f"ℹ Tabela {table}: {len(data)} tabel w odpowiedzi, przetwarzam...")
+        WRITER.submit(table, write_entries, data, os.path.join(table_dir(table), "bad_entries"), table)
+    # ostatnie n tabel to kolejne publikacje — brak dnia sprzed najnowszej oznacza lukę (albo dzień bez tabeli)
+    gap = [d for d in expected if returned and d < max(returned) and d not in returned]
+    if gap:
+        print(f"🩹 Tabela {table}: luka {gap[0].isoformat()} — {gap[-1].isoformat()}, naprawiam zakresem")
+        sync(gap[0], gap[-1], table=table)
+    return True
+
+
+def fetch_recent_and_today(today: date, lookback_days: int = 7, table: str = "A"):
     start = today - timedelta(days=lookback_days - 1)
-    print(f"🔎 Próba pobrania zakresu {start.isoformat()} — {today.isoformat()}")
-    data = fetch_range(start, today)
+    print(f"🔎 Tabela {table}: próba pobrania zakresu {start.isoformat()} — {today.isoformat()}")
+    bad_dir = os.path.join(table_dir(table), "bad_entries")
+    data = fetch_range(start, today, table)
     if data:
         print(f"ℹ Znalazłem {len(data)} wpisów w zakresie, przetwarzam...")
-        for entry in data:
-            process_table_entry(entry)
+        WRITER.submit(table, write_entries, data, bad_dir, table)
         return True
 
     print("ℹ Zakres nic nie zwrócił — próbuję pojedynczych dni wstecz")
     for i in range(0, lookback_days):
         d = today - timedelta(days=i)
-        url = SINGLE_DAY_URL.format(date=d.isoformat())
+        if not is_publication_day(d):
+            print(f"ℹ {d.isoformat()}: dzień wolny — pomijam")
+            continue
+        url = SINGLE_DAY_URL.format(table=table, date=d.isoformat())
         resp = http_get(url)
         if isinstance(resp, urllib.error.HTTPError):
             # 404 -> brak tabeli w tym dniu (weekend/święto)
@@ -510,15 +2759,153 @@ def fetch_recent_and_today(today: date, lookback_days: int = 7):
             return False
         if data:
             print(f"ℹ {d.isoformat()}: znaleziono dane, przetwarzam...")
-            for entry in data:
-                process_table_entry(entry)
+            WRITER.submit(table, write_entries, data, bad_dir, table)
             return True
 
     print(f"ℹ Brak kursów w ostatnich {lookback_days} dniach (weekend/święta).")
     return True
 
 
-def main():
+# -------------------
+# Orkiestrator zbiorów danych
+# -------------------
+
+def run_table(table: str, today: date, workers: Optional[int] = None):
+    """
+    Domyślny przebieg tabeli dziennej (A/C): backfill, jeśli nie był wykonany, i nowe dni
+    (szybka ścieżka; przy błędzie — zakres 7 dni i pojedyncze dni).
+    """
+    if not os.path.exists(table_file(table, BACKFILL_MARKER)):
+        # backfill sięga do dzisiaj — szybka ścieżka nie ma już czego dodać
+        backfill(workers=workers, table=table)
+        return
+    print(f"✔ Backfill tabeli {table} już wykonany")
+    if not fetch_latest(today, table):
+        fetch_recent_and_today(today, lookback_days=7, table=table)
+
+
+def run_table_b(today: Optional[date] = None, workers: Optional[int] = None, full: bool = False):
+    """
+    Tabela B: luki liczone tygodniami; po backfillu wystarczą ostatnie 2 tygodnie.
+    """
+    full = full or not os.path.exists(table_file("B", BACKFILL_MARKER))
+    failed = sync_table_b(None if full or today is None else today - timedelta(days=13), today, workers=workers)
+    if full and failed:
+        print(f"⚠ Tabela B: {failed} zakresów bez danych — nie zapisuję {table_file('B', BACKFILL_MARKER)}")
+    elif full:
+        WRITER.submit("B", write_backfill_marker, "B")
+
+
+def dataset_jobs(command: str, datasets, args, today: date):
+    """
+    Lista (zbiór, zadanie) dla komendy run/backfill/sync/gold.
+    """
+    jobs = []
+    for name in datasets:
+        if name == "GOLD":
+            if command in ("sync", "gold"):
+                job = functools.partial(sync_gold, args.start, args.end, args.workers)
+            else:
+                job = functools.partial(sync_gold, workers=args.workers)
+        elif name == "B":
+            if command == "sync":
+                job = functools.partial(sync_table_b, args.start, args.end, args.workers)
+            else:
+                job = functools.partial(run_table_b, today, args.workers, command == "backfill")
+        elif command == "sync":
+            job = functools.partial(sync, args.start, args.end, args.workers, name)
+        elif command == "backfill":
+            job = functools.partial(backfill, args.workers, name)
+        else:
+            job = functools.partial(run_table, name, today, args.workers)
+        jobs.append((name, job))
+    return jobs
+
+
+def run_datasets(jobs):
+    """
+    Pobiera wszystkie zbiory danych naraz — każdy w osobnym wątku, ze wspólnymi HTTP_POOL,
+    limitem połączeń do hosta i RATE_LIMITER — a zapisuje je w jednym etapie (WRITER) w wątku głównym.
+    Czasy pobierania i zapisu każdego zbioru trafiają do dziennika przebiegu.
+    """
+    def timed(name, job):
+        t0 = time.monotonic()
+        try:
+            job()
+        finally:
+            LEDGER.add_time(name, "fetch_s", time.monotonic() - t0)
+
+    if not jobs:
+        return
+    with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="nbp-dataset") as pool:
+        futures = [pool.submit(timed, name, job) for name, job in jobs]
+        WRITER.run_until(futures)
+    for (name, _), fut in zip(jobs, futures):
+        if fut.exception() is not None:
+            print(f"❌ Błąd zbioru {name}:", fut.exception())
+    for name, stats in LEDGER.datasets.items():
+        print(f"⏱ {name}: pobieranie {stats['fetch_s']:.1f}s, zapis {stats['write_s']:.1f}s")
+
+
+def check_store(start_d: Optional[date] = None, end_d: Optional[date] = None, table: str = "A"):
+    """
+    Porównuje offline oczekiwane dni publikacji z plikami w magazynie.
+    Zwraca (brakujące, nadmiarowe) jako posortowane listy dat.
+    """
+    today = datetime.now(ZoneInfo(TZ)).date()
+    start_d = start_d or START_DATE
+    end_d = min(end_d or today, today)
+    present = {d for d in scan_store(table) if start_d <= d <= end_d}
+    expected = set(expected_publication_dates(start_d, end_d)) - load_no_table_dates(table)
+    missing = sorted(expected - present)
+    extra = sorted(present - expected)
+    print(f"🔍 {start_d.isoformat()} — {end_d.isoformat()}: oczekiwane {len(expected)}, "
+          f"w magazynie {len(present)}, brakujące {len(missing)}, poza kalendarzem {len(extra)}")
+    for d in missing:
+        print("  brak:", d.isoformat())
+    for d in extra:
+        print("  poza kalendarzem:", d.isoformat())
+    return missing, extra
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pobieranie danych NBP (tabele A, B, C i ceny złota) do docs/")
+    parser.add_argument(
+        "command", nargs="?", default="run",
+        choices=["run", "backfill", "sync", "check", "archive", "bin", "normalize", "manifest", "series", "zdict",
+                 "currencies", "gold"],
+        help="run: backfill jeśli potrzeba + ostatnie dni (domyślnie); "
+             "backfill: pełne pobranie od START_YEAR; sync: uzupełnienie brakujących dni; "
+             "check: porównanie magazynu z kalendarzem (bez sieci); "
+             "archive: przebudowa rocznych archiwów z plików dziennych; "
+             "bin: budowa binarnej macierzy kursów (RATES_BIN_PATH); "
+             "normalize: jeden plik na dzień w formacie STORE_FORMAT (usuwa duplikaty); "
+             "manifest: przebudowa docs/exc/manifest.json; "
+             "series: przebudowa szeregów per waluta w docs/api/series; "
+             "zdict: budowa słownika zlib dla STORE_FORMAT=zd; "
+             "currencies: przebudowa tabeli nazw walut (currencies.json); "
+             "gold: dopisanie cen złota do NBP_GOLD_PATH (--from wymusza ponowne pobranie)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="liczba wątków pobierających")
+    parser.add_argument(
+        "--dataset", "--table", dest="datasets", action="append", type=str.upper, choices=DATASET_NAMES,
+        default=None, help="zbiór danych dla run/backfill/sync/check (można powtórzyć; domyślnie NBP_DATASETS)",
+    )
+    parser.add_argument("--dedupe-only", action="store_true", help="normalize: tylko usuń duplikaty, bez konwersji .json")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, default=None, help="początek zakresu (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, default=None, help="koniec zakresu (YYYY-MM-DD)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    datasets = args.datasets or DATASETS or ["A"]
+    if args.command == "check":
+        missing = [
+            d for table in datasets if table != "GOLD"
+            for d in (check_table_b(args.start, args.end) if table == "B" else check_store(args.start, args.end, table)[0])
+        ]
+        sys.exit(1 if missing else 0)
     ensure_base_dir()
 
     # 1) migracja legacy (przeniesienie wszystkich istniejących plików do katalogów z rokiem)
@@ -527,13 +2914,36 @@ def main():
     except Exception as e:
         print("❌ Błąd podczas migracji legacy (kontynuuję):", e)
 
-    # 2) normalny przebieg: backfill jeśli potrzeba + pobranie ostatnich dni
+    compact_last_marker()
+
     today = datetime.now(ZoneInfo(TZ)).date()
-    if not os.path.exists(BACKFILL_MARKER):
-        backfill()
-    else:
-        print("✔ Backfill już wykonany")
-    fetch_recent_and_today(today, lookback_days=7)
+    with LEDGER.phase(args.command):
+        if args.command == "archive":
+            rebuild_archives()
+            write_web_manifest()
+        elif args.command == "bin":
+            build_rate_matrix()
+        elif args.command == "normalize":
+            normalize_store(dedupe_only=args.dedupe_only)
+            write_web_manifest()
+        elif args.command == "manifest":
+            write_web_manifest()
+        elif args.command == "series":
+            rebuild_series()
+        elif args.command == "zdict":
+            build_zdict()
+        elif args.command == "currencies":
+            build_currencies()
+        elif args.command == "gold":
+            run_datasets(dataset_jobs("gold", ["GOLD"], args, today))
+        else:
+            # 2) run/backfill/sync: wszystkie zbiory danych naraz, wspólny budżet HTTP i jeden etap zapisu
+            run_datasets(dataset_jobs(args.command, datasets, args, today))
+    with LEDGER.phase("derived"):
+        flush_derived()
+    HTTP_POOL.close()
+    shutdown_compress_pool()
+    LEDGER.flush(args.command)
     sys.exit(0)
 
 